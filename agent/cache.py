@@ -0,0 +1,169 @@
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, Optional, Set
+from urllib.parse import urlparse
+
+from .config import ENRICHMENT_CACHE_PATH, ENRICHMENT_CACHE_TTL_SECONDS, FIELD_MAX_AGE_DAYS
+
+
+def normalize_domain(website: str) -> str:
+    """Reduce a website URL to its bare host, e.g. 'https://www.Acme.com/about' -> 'acme.com'."""
+    value = (website or "").strip().lower()
+    if not value:
+        return ""
+    if "://" not in value:
+        value = "//" + value.lstrip("/")
+    try:
+        host = urlparse(value).hostname or ""
+    except ValueError:
+        return ""
+    if host.startswith("www."):
+        host = host[4:]
+    return host.rstrip(".")
+
+
+class EnrichmentCache:
+    """Persistent SQLite cache of enrichment results.
+
+    Whole results are keyed by normalized website domain and the hash of the ICP
+    document they were ranked against. Per-field records are keyed by domain and
+    remember the ICP hash too, so ranking fields can be told apart from research
+    that holds for any ICP.
+    """
+
+    def __init__(self, path: str = ENRICHMENT_CACHE_PATH, default_ttl: float = ENRICHMENT_CACHE_TTL_SECONDS) -> None:
+        self.path = path
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # Entries of the old domain-only table were ranked against an unknown ICP
+        self._conn.execute("DROP TABLE IF EXISTS enrichment_cache")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS enrichment_results (
+                domain TEXT NOT NULL,
+                icp_hash TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                ttl REAL NOT NULL,
+                PRIMARY KEY (domain, icp_hash)
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS enrichment_fields (
+                domain TEXT NOT NULL,
+                field TEXT NOT NULL,
+                value TEXT NOT NULL,
+                source TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                icp_hash TEXT NOT NULL DEFAULT '',
+                PRIMARY KEY (domain, field)
+            )
+            """
+        )
+        field_columns = {row[1] for row in self._conn.execute("PRAGMA table_info(enrichment_fields)")}
+        if "icp_hash" not in field_columns:
+            self._conn.execute("ALTER TABLE enrichment_fields ADD COLUMN icp_hash TEXT NOT NULL DEFAULT ''")
+        self._conn.commit()
+
+    def get(self, website: str, icp_hash: str = "") -> Optional[Dict[str, Any]]:
+        """Return the result cached for a website and ICP, or None on a miss or expired entry."""
+        domain = normalize_domain(website)
+        if not domain:
+            self.misses += 1
+            return None
+
+        row = self._conn.execute(
+            "SELECT data, created_at, ttl FROM enrichment_results WHERE domain = ? AND icp_hash = ?", (domain, icp_hash)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        data, created_at, ttl = row
+        if time.time() - created_at > ttl:
+            self._conn.execute("DELETE FROM enrichment_results WHERE domain = ? AND icp_hash = ?", (domain, icp_hash))
+            self._conn.commit()
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return json.loads(data)
+
+    def set(self, website: str, data: Dict[str, Any], ttl: Optional[float] = None, icp_hash: str = "") -> None:
+        """Store the flattened result for a website and ICP, replacing any previous entry."""
+        domain = normalize_domain(website)
+        if not domain:
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO enrichment_results (domain, icp_hash, data, created_at, ttl) VALUES (?, ?, ?, ?, ?)",
+            (domain, icp_hash, json.dumps(data), time.time(), ttl if ttl is not None else self.default_ttl)
+        )
+        self._conn.commit()
+
+    def get_fields(self, website: str) -> Dict[str, Dict[str, Any]]:
+        """Return every stored field for a website as {field: {value, source, updated_at, icp_hash}}."""
+        domain = normalize_domain(website)
+        if not domain:
+            return {}
+        rows = self._conn.execute(
+            "SELECT field, value, source, updated_at, icp_hash FROM enrichment_fields WHERE domain = ?", (domain,)
+        ).fetchall()
+        return {
+            field: {"value": json.loads(value), "source": source, "updated_at": updated_at, "icp_hash": icp_hash}
+            for field, value, source, updated_at, icp_hash in rows
+        }
+
+    def set_fields(self, website: str, values: Dict[str, Any], sources: Dict[str, str], icp_hash: str = "") -> None:
+        """Record freshly enriched field values with their source, the ICP in use and the current time."""
+        domain = normalize_domain(website)
+        if not domain or not values:
+            return
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO enrichment_fields (domain, field, value, source, updated_at, icp_hash) VALUES (?, ?, ?, ?, ?, ?)",
+            [(domain, field, json.dumps(value), sources.get(field, "unknown"), now, icp_hash) for field, value in values.items()]
+        )
+        self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def stale_fields(
+    records: Dict[str, Dict[str, Any]],
+    fields: Iterable[str],
+    max_age_days: Optional[Dict[str, Optional[float]]] = None,
+    icp_fields: Iterable[str] = (),
+    icp_hash: str = ""
+) -> Set[str]:
+    """Return the fields that are missing, empty or older than their configured maximum age.
+
+    A maximum age of None means the field never goes stale once it has a value.
+    Fields in `icp_fields` are also stale when they were produced for another ICP.
+    """
+    max_age_days = FIELD_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    icp_fields = set(icp_fields)
+    now = time.time()
+    stale: Set[str] = set()
+    for field in fields:
+        record = records.get(field)
+        if not record or record["value"] in ("", None, [], {}):
+            stale.add(field)
+            continue
+        if field in icp_fields and record.get("icp_hash", "") != icp_hash:
+            stale.add(field)
+            continue
+        max_age = max_age_days.get(field)
+        if max_age is not None and now - record["updated_at"] > max_age * 24 * 60 * 60:
+            stale.add(field)
+    return stale
@@ -0,0 +1,56 @@
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+CHECKPOINT_FILE = "checkpoint.json"
+
+
+def checkpoint_path(session_dir: str) -> str:
+    return os.path.join(session_dir, CHECKPOINT_FILE)
+
+
+def read_checkpoint(session_dir: str) -> Optional[Dict[str, Any]]:
+    """Return the checkpoint marker for a session, or None if there is none."""
+    path = checkpoint_path(session_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def write_checkpoint(session_dir: str, **fields: Any) -> Dict[str, Any]:
+    """Merge fields into the checkpoint marker and replace it atomically on disk."""
+    checkpoint = read_checkpoint(session_dir) or {}
+    checkpoint.update(fields)
+    checkpoint["updated_at"] = datetime.now().isoformat()
+
+    path = checkpoint_path(session_dir)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return checkpoint
+
+
+def clear_checkpoint(session_dir: str) -> None:
+    path = checkpoint_path(session_dir)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def repair_partial_tail(output_path: str) -> None:
+    """Drop a trailing half-written line left behind by a crash mid-append."""
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, 'rb+') as f:
+        data = f.read()
+        if not data or data.endswith(b"\n"):
+            return
+        f.truncate(data.rfind(b"\n") + 1)
+
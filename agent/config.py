@@ -9,5 +9,100 @@ CSV_OUTPUT = "enriched_companies.csv"
 # Number of retries for API calls
 MAX_RETRIES = 1
 
+# Number of company rows enriched concurrently
+MAX_CONCURRENT_ROWS = 4
+
+# Rows parsed per chunk when streaming CSV uploads
+INGEST_CHUNK_SIZE = 5000
+# Input rows read between progress events carrying the running row count
+INGEST_PROGRESS_EVERY_ROWS = 100
+
+# companies.csv is written in batches: whichever comes first of this many rows or seconds
+RESULT_FLUSH_ROWS = 25
+RESULT_FLUSH_INTERVAL_SECONDS = 2.0
+
+# Research pipeline layout: "sequential", "parallel" (researchers fan out, ranking waits)
+# or "gated" (cheap qualification first, deep research only for qualifying companies)
+PIPELINE_MODE = "parallel"
+
+# Minimum qualification score (1-10) a company needs before gated mode deep-researches it
+QUALIFICATION_SCORE_THRESHOLD = 6
+
+# Persistent enrichment cache shared across sessions
+ENRICHMENT_CACHE_ENABLED = True
+ENRICHMENT_CACHE_PATH = os.path.join(BASE_DIR, 'files', 'enrichment_cache.db')
+ENRICHMENT_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+
+# Maximum age in days before a stored field is re-researched in refresh mode (None = never)
+FIELD_MAX_AGE_DAYS = {
+    "ceo_name": 30,
+    "ceo_email": 30,
+    "company_revenue": 180,
+    "company_employee_count": 90,
+    "company_founding_year": None,
+    "target_industries": 180,
+    "target_company_size": 180,
+    "target_geography": 180,
+    "client_examples": 180,
+    "service_focus": 180,
+    "ranking": 30,
+    "reasoning": 30
+}
+
+# Provider rate limits (requests and tokens per minute) shared by every caller in the process
+RATE_LIMITS = {
+    "gemini": {
+        "gemini-2.0-flash": {"rpm": 2000, "tpm": 4_000_000},
+        "gemini-2.0-flash-lite": {"rpm": 4000, "tpm": 4_000_000},
+        "gemini-1.5-pro": {"rpm": 1000, "tpm": 4_000_000},
+        "default": {"rpm": 1000, "tpm": 1_000_000}
+    },
+    "perplexity": {
+        "sonar": {"rpm": 50},
+        "default": {"rpm": 50}
+    }
+}
+
+# Optional SQLite file so rate limit buckets are shared across processes (None = in-process only)
+RATE_LIMIT_DB_PATH = None
+
+# Connection pool of the shared Perplexity HTTP client
+PERPLEXITY_MAX_CONNECTIONS = 20
+PERPLEXITY_MAX_KEEPALIVE_CONNECTIONS = 10
+PERPLEXITY_KEEPALIVE_EXPIRY = 30.0
+
+# Fallback research requests arriving within the window are sent as one batched call (1 = no batching)
+PERPLEXITY_BATCH_SIZE = 5
+PERPLEXITY_BATCH_WINDOW_SECONDS = 1.0
+
+# Start the Perplexity fallback alongside a row's agent pipeline if it has produced no
+# usable JSON after this many seconds; the first complete result wins (None disables hedging)
+PERPLEXITY_HEDGE_AFTER_SECONDS = None
+
 # Document content path
-BIZZZUP_DOCUMETS = os.path.join(BASE_DIR, 'files', 'BIZZZUP.docx')
\ No newline at end of file
+BIZZZUP_DOCUMETS = os.path.join(BASE_DIR, 'files', 'BIZZZUP.docx')
+
+# Compact ICP profiles distilled from the company document, cached by document content hash
+ICP_PROFILE_DIR = os.path.join(BASE_DIR, 'files', 'icp_profiles')
+ICP_PROFILE_MODEL = "gemini-2.0-flash-lite"
+ICP_PROFILE_MAX_CHARS = 3000
+# In-process event bus from a running job to the web app's Socket.IO rooms
+EVENT_BUS_FLUSH_INTERVAL_SECONDS = 0.1
+EVENT_BUS_MAX_BATCH = 500
+# Events a session may have waiting before the bus drops them and asks for a resync from disk
+EVENT_BUS_MAX_PENDING = 10000
+
+# Page sizes of the /get-companies API
+COMPANIES_PAGE_SIZE = 50
+COMPANIES_MAX_PAGE_SIZE = 500
+
+# Page sizes of the /get-logs API
+LOGS_PAGE_SIZE = 100
+LOGS_MAX_PAGE_SIZE = 1000
+
+# logs.db is written in batches: whichever comes first of this many records or seconds
+LOG_FLUSH_RECORDS = 50
+LOG_FLUSH_INTERVAL_SECONDS = 1.0
+
+# Compact Socket.IO wire format: payloads at least this large (in bytes of JSON) are zlib-compressed
+WIRE_COMPRESS_MIN_BYTES = 1024
@@ -0,0 +1,116 @@
+import collections
+import json
+import logging
+import time
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .config import EVENT_BUS_MAX_PENDING
+
+# Event kinds published by a running job
+EVENT_LOG = "log"
+EVENT_ROWS = "rows"
+# Input rows read so far: {"total": n, "final": bool}; final once the whole file has been read
+EVENT_TOTAL = "total"
+
+
+class SessionChannel:
+    """Pending events of one session, published by the job and drained by a dispatcher.
+
+    The job runs on its own OS thread and the dispatcher on the web server's event
+    loop, so the channel only uses deque appends and pops, which are atomic.
+    Publishers never block: past `max_pending` waiting events new ones are
+    dropped and the channel is flagged with the time of the last drop, so the
+    dispatcher can resync the clients that missed them from the session's files
+    (which remain the durable record) instead.
+    """
+
+    def __init__(self, max_pending: int = EVENT_BUS_MAX_PENDING) -> None:
+        self.max_pending = max_pending
+        self.events: Deque[Tuple[str, Any]] = collections.deque()
+        self.overflowed = False
+        self.last_drop_at = 0.0
+        self.closed = False
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, kind: str, payload: Any) -> None:
+        if len(self.events) >= self.max_pending:
+            self.overflowed = True
+            self.last_drop_at = time.monotonic()
+            self.dropped += 1
+            return
+        self.events.append((kind, payload))
+        self.published += 1
+
+    def drain(self, max_items: int) -> List[Tuple[str, Any]]:
+        batch = []
+        while self.events and len(batch) < max_items:
+            batch.append(self.events.popleft())
+        return batch
+
+
+class EventBus:
+    """Per-session publish/subscribe channels between running jobs and the web app.
+
+    Only sessions opened by a subscriber get a channel; publishing to any other
+    session (e.g. a job started from the command line) is a no-op.
+    """
+
+    def __init__(self) -> None:
+        self._channels: Dict[str, SessionChannel] = {}
+
+    def open(self, session_id: str, max_pending: int = EVENT_BUS_MAX_PENDING) -> SessionChannel:
+        channel = SessionChannel(max_pending)
+        self._channels[session_id] = channel
+        return channel
+
+    def close(self, session_id: str) -> None:
+        """Stop accepting events; the channel is dropped once its pending events are drained."""
+        channel = self._channels.get(session_id)
+        if channel is not None:
+            channel.closed = True
+
+    def remove(self, session_id: str) -> None:
+        self._channels.pop(session_id, None)
+
+    def get(self, session_id: str) -> Optional[SessionChannel]:
+        return self._channels.get(session_id)
+
+    def channels(self) -> List[Tuple[str, SessionChannel]]:
+        return list(self._channels.items())
+
+    def publish(self, session_id: str, kind: str, payload: Any) -> None:
+        channel = self._channels.get(session_id)
+        if channel is not None and not channel.closed:
+            channel.publish(kind, payload)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            session_id: {
+                "pending": len(channel.events),
+                "published": channel.published,
+                "dropped": channel.dropped,
+                "closed": channel.closed
+            }
+            for session_id, channel in self.channels()
+        }
+
+
+event_bus = EventBus()
+
+
+class EventBusHandler(logging.Handler):
+    """Logging handler that publishes each formatted JSON log record to a session's channel."""
+
+    def __init__(self, session_id: str, bus: EventBus = event_bus) -> None:
+        super().__init__()
+        self.session_id = session_id
+        self.bus = bus
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.bus.get(self.session_id) is None:
+            return
+        try:
+            self.bus.publish(self.session_id, EVENT_LOG, json.loads(self.format(record)))
+        except Exception:
+            self.handleError(record)
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Dict, Optional, Tuple
+
+from google import genai
+
+from .config import BIZZZUP_DOCUMETS, ICP_PROFILE_DIR, ICP_PROFILE_MODEL, ICP_PROFILE_MAX_CHARS
+from .monitoring import current_usage
+from .rate_limiter import get_rate_limiter
+from .sub_agents.tools.read_google_docs import read_doc
+
+DISTILL_PROMPT = """Condense the company description below into a compact ideal customer profile (ICP)
+that another model will use to score potential collaboration partners.
+
+Use short bullet points under these headings and nothing else:
+- Our company: what we do, in one or two lines
+- Core services
+- Ideal customer industries
+- Ideal customer size and stage
+- Ideal customer geography
+- Signals of a strong fit
+- Signals of a poor fit
+
+Stay under {max_chars} characters. Do not invent anything that is not in the document.
+
+Document:
+{document}"""
+
+# (path, mtime, size) -> content hash, so unchanged documents are not re-hashed
+_hash_memo: Dict[Tuple[str, float, int], str] = {}
+# content hash -> profile, for profiles that could not be written to disk
+_profile_memo: Dict[str, str] = {}
+
+
+def document_hash(path: str) -> str:
+    """SHA-256 of a document's bytes, memoized on its modification time and size."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime, stat.st_size)
+    digest = _hash_memo.get(key)
+    if digest is None:
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        _hash_memo[key] = digest
+    return digest
+
+
+def _profile_path(digest: str) -> str:
+    return os.path.join(ICP_PROFILE_DIR, f"{digest}.json")
+
+
+def compact_text(text: str, max_chars: int = ICP_PROFILE_MAX_CHARS) -> str:
+    """Whitespace-normalized, de-duplicated document text, cut at `max_chars`."""
+    seen = set()
+    lines = []
+    for line in (text or "").splitlines():
+        line = re.sub(r"\s+", " ", line).strip()
+        if line and line.lower() not in seen:
+            seen.add(line.lower())
+            lines.append(line)
+    return "\n".join(lines)[:max_chars]
+
+
+async def _distill(text: str) -> str:
+    prompt = DISTILL_PROMPT.format(max_chars=ICP_PROFILE_MAX_CHARS, document=text)
+    await get_rate_limiter("gemini", ICP_PROFILE_MODEL).acquire(len(prompt) // 4)
+    response = await genai.Client().aio.models.generate_content(model=ICP_PROFILE_MODEL, contents=prompt)
+    if response.usage_metadata:
+        tracker = current_usage()
+        if tracker is not None:
+            tracker.add_genai_usage("ICPProfile", ICP_PROFILE_MODEL, response.usage_metadata)
+    profile = (response.text or "").strip()
+    if not profile:
+        raise ValueError("Empty ICP profile returned")
+    return profile[:ICP_PROFILE_MAX_CHARS]
+
+
+async def load_icp_profile(path: Optional[str] = None) -> str:
+    """Return the compact ICP profile for a .docx, distilling it once per document version.
+
+    Profiles are cached on disk under ICP_PROFILE_DIR by the document's content
+    hash, so editing the document (or pointing a job at a different one) yields
+    a new profile without restarting the process. If the model call fails, a
+    compacted copy of the document text is used for this process only.
+    """
+    path = path or BIZZZUP_DOCUMETS
+    digest = document_hash(path)
+    if digest in _profile_memo:
+        return _profile_memo[digest]
+
+    cache_path = _profile_path(digest)
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                profile = json.load(f)["profile"]
+            _profile_memo[digest] = profile
+            return profile
+        except (OSError, ValueError, KeyError):
+            pass
+
+    text = read_doc(path) or ""
+    try:
+        profile = await _distill(text)
+    except Exception as e:
+        print(f"Could not distill ICP profile from {path}, using compacted document text: {e}")
+        profile = compact_text(text)
+        _profile_memo[digest] = profile
+        return profile
+
+    os.makedirs(ICP_PROFILE_DIR, exist_ok=True)
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "source": os.path.abspath(path),
+            "model": ICP_PROFILE_MODEL,
+            "created_at": time.time(),
+            "document_chars": len(text),
+            "profile": profile
+        }, f)
+    os.replace(tmp_path, cache_path)
+    _profile_memo[digest] = profile
+    return profile
@@ -0,0 +1,131 @@
+import csv
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from .cache import normalize_domain
+from .config import INGEST_CHUNK_SIZE
+
+REQUIRED_INPUT_COLUMNS = ("Company Name", "Website")
+
+
+def normalize_company_name(name: str) -> str:
+    """Lower-case a company name and collapse whitespace for duplicate matching."""
+    return re.sub(r"\s+", " ", (name or "").strip().lower())
+
+
+class CompanyGroup:
+    """One unique company and every input row that refers to it."""
+
+    def __init__(self, company: str, website: str) -> None:
+        self.company = company
+        self.website = website
+        self.members: List[Tuple[Any, str, str]] = []
+        self.result: Optional[Dict[str, Any]] = None
+
+
+class DuplicateCollapser:
+    """Collapse input rows that point at the same company.
+
+    Rows are matched on their canonical website domain (scheme, ``www.``, path and
+    trailing slashes ignored). Only rows without a usable domain fall back to the
+    normalized company name, so namesakes on different domains stay separate.
+    Only the first row of each group needs to be enriched; its result is fanned
+    back out to every member.
+    """
+
+    def __init__(self) -> None:
+        self._by_domain: Dict[str, CompanyGroup] = {}
+        self._by_name: Dict[str, CompanyGroup] = {}
+        self.total_rows = 0
+        self.unique_companies = 0
+
+    def add(self, idx: Any, company: str, website: str) -> Tuple[CompanyGroup, bool]:
+        """Register a row and return its group plus whether the group is new."""
+        self.total_rows += 1
+        domain = normalize_domain(website)
+        name = normalize_company_name(company)
+
+        if domain:
+            group = self._by_domain.get(domain)
+        else:
+            group = self._by_name.get(name) if name else None
+
+        is_new = group is None
+        if is_new:
+            group = CompanyGroup(company, website)
+            self.unique_companies += 1
+
+        if domain:
+            self._by_domain.setdefault(domain, group)
+        if name:
+            self._by_name.setdefault(name, group)
+
+        group.members.append((idx, company, website))
+        return group, is_new
+
+    @property
+    def duplicate_rows(self) -> int:
+        return self.total_rows - self.unique_companies
+
+
+def _input_format(path: str) -> str:
+    ext = Path(path).suffix.lower()
+    if ext == ".csv":
+        return "csv"
+    if ext in {".xlsx", ".xls"}:
+        return "xlsx"
+    raise ValueError(f"Unsupported file format: {ext}")
+
+
+def _cell_text(value: Any) -> str:
+    return "" if value is None else str(value).strip()
+
+
+def _iter_xlsx(path: str) -> Iterator[Tuple[str, ...]]:
+    """Yield the header and then every non-blank row of the first sheet, in read-only mode."""
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for values in workbook.active.iter_rows(values_only=True):
+            row = tuple(_cell_text(value) for value in values)
+            if any(row):
+                yield row
+    finally:
+        workbook.close()
+
+
+def read_input_header(path: str) -> List[str]:
+    """Return the column names of an input file without reading its rows."""
+    if _input_format(path) == "csv":
+        with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+            return [_cell_text(col) for col in next(csv.reader(f), [])]
+    return list(next(_iter_xlsx(path), ()))
+
+
+def missing_input_columns(columns: List[str]) -> List[str]:
+    return [col for col in REQUIRED_INPUT_COLUMNS if col not in columns]
+
+
+def iter_input_rows(path: str, chunksize: int = INGEST_CHUNK_SIZE) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """Lazily yield (row index, {column: stripped text}) for every data row of a CSV/XLSX input.
+
+    CSV files are parsed `chunksize` rows at a time and workbooks are streamed in
+    openpyxl read-only mode, so memory stays flat regardless of file size. Row
+    indices are 0-based and stable across runs, which resume relies on.
+    """
+    if _input_format(path) == "csv":
+        reader = pd.read_csv(path, chunksize=chunksize, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+        for chunk in reader:
+            chunk.columns = [_cell_text(col) for col in chunk.columns]
+            for idx, record in zip(chunk.index, chunk.to_dict('records')):
+                yield int(idx), {col: _cell_text(value) for col, value in record.items()}
+        return
+
+    rows = _iter_xlsx(path)
+    columns = next(rows, ())
+    for idx, row in enumerate(rows):
+        # Read-only sheets drop trailing empty cells, so short rows are padded to the header
+        yield idx, dict(zip(columns, row + ("",) * (len(columns) - len(row))))
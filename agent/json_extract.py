@@ -0,0 +1,111 @@
+import json
+import os
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional, Type
+
+# Decoding starts at the first candidate opener; fences and surrounding prose are
+# skipped over rather than split off, so nested values and braces in strings are
+# handled by the real JSON decoder instead of regexes.
+_DECODER = json.JSONDecoder()
+_OPENERS = {None: re.compile(r"[{\[]"), dict: re.compile(r"\{"), list: re.compile(r"\[")}
+# A failed decode can read to the end of the text, so only this many openers are tried
+MAX_DECODE_ATTEMPTS = 32
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "json_extract_corpus.json")
+
+
+def extract_json(
+    text: Optional[str],
+    expected_type: Optional[Type] = None,
+    accept: Optional[Callable[[Any], bool]] = None
+) -> Any:
+    """Decode the first complete JSON value in a model response.
+
+    Each `{` (or `[`) from left to right is handed to `JSONDecoder.raw_decode`.
+    A value that decodes but is the wrong type, or is rejected by `accept`, is
+    skipped as a whole; an opener that does not start a value (or nests too
+    deeply to decode) is skipped by one character. A failed attempt may read the
+    rest of the text, so at most MAX_DECODE_ATTEMPTS openers are tried. Prose,
+    citation markers and code fences around the value are ignored. Raises
+    json.JSONDecodeError if no such value is found.
+    """
+    text = text or ""
+    opener = _OPENERS[expected_type]
+    decode = _DECODER.raw_decode
+    match = opener.search(text)
+    attempts = 0
+    while match and attempts < MAX_DECODE_ATTEMPTS:
+        attempts += 1
+        pos = match.start()
+        try:
+            value, end = decode(text, pos)
+        except (json.JSONDecodeError, RecursionError):
+            match = opener.search(text, pos + 1)
+            continue
+        if (expected_type is None or isinstance(value, expected_type)) and (accept is None or accept(value)):
+            return value
+        match = opener.search(text, end)
+    raise json.JSONDecodeError("No JSON value found", text, 0)
+
+
+def extract_json_object(text: Optional[str]) -> Dict[str, Any]:
+    """Decode the first JSON object in a model response."""
+    return extract_json(text, dict)
+
+
+def _is_records(value: List[Any]) -> bool:
+    return all(isinstance(item, dict) for item in value)
+
+
+def extract_json_records(text: Optional[str]) -> List[Dict[str, Any]]:
+    """Decode the first JSON array of objects, skipping citation markers such as `[1]`."""
+    return extract_json(text, list, _is_records)
+
+
+_EXTRACTORS = {None: extract_json, "object": extract_json_object, "array": lambda text: extract_json(text, list), "records": extract_json_records}
+
+
+def load_corpus(path: str = CORPUS_PATH) -> List[Dict[str, Any]]:
+    """Recorded model outputs with the value each should decode to (or null for none)."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def check_corpus(corpus: List[Dict[str, Any]]) -> List[str]:
+    """Return the names of corpus entries whose extraction does not match the expected value."""
+    failures = []
+    for case in corpus:
+        try:
+            value = _EXTRACTORS[case.get("type")](case["text"])
+        except json.JSONDecodeError:
+            value = None
+        if value != case["expected"]:
+            failures.append(case["name"])
+    return failures
+
+
+def benchmark(iterations: int = 2_000) -> Dict[str, Any]:
+    """Time extraction over the corpus, the way it runs on every agent event."""
+    corpus = load_corpus()
+    texts = [(case["text"], _EXTRACTORS[case.get("type")]) for case in corpus]
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for text, extractor in texts:
+            try:
+                extractor(text)
+            except json.JSONDecodeError:
+                pass
+    elapsed = time.perf_counter() - start
+    calls = iterations * len(texts)
+    return {
+        "cases": len(texts),
+        "failures": check_corpus(corpus),
+        "calls": calls,
+        "seconds": round(elapsed, 4),
+        "us_per_call": round(elapsed / calls * 1e6, 2)
+    }
+
+
+if __name__ == "__main__":
+    print(benchmark())
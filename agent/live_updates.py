@@ -0,0 +1,38 @@
+from typing import Any, Dict, List
+
+from .log_store import empty_token_usage, open_log_store
+from .results import open_result_store
+
+
+def group_logs(logs: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    grouped_logs: Dict[str, List[Dict[str, Any]]] = {}
+    for log in logs:
+        grouped_logs.setdefault(log.get('agent', 'general'), []).append(log)
+    return grouped_logs
+
+
+def read_session_snapshot(session_dir: str) -> Dict[str, Any]:
+    """The session's token totals, stored row count and newest log id.
+
+    Token totals are kept up to date by the log store, so nothing is re-summed.
+    Clients page the logs up to `log_cursor` from /get-logs themselves. Used to
+    seed a client on connect and to resync one whose live events were dropped;
+    running jobs push everything after that through the event bus.
+    """
+    token_usage, log_cursor = empty_token_usage(), 0
+    log_store = open_log_store(session_dir)
+    if log_store is not None:
+        try:
+            token_usage, log_cursor = log_store.token_usage(), log_store.last_id()
+        finally:
+            log_store.close()
+
+    processed = 0
+    store = open_result_store(session_dir)
+    if store is not None:
+        try:
+            processed = store.count()
+        finally:
+            store.close()
+
+    return {'log_cursor': log_cursor, 'token_usage': token_usage, 'processed': processed}
@@ -0,0 +1,277 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .config import LOG_FLUSH_INTERVAL_SECONDS, LOG_FLUSH_RECORDS
+
+LOGS_DB_FILE = "logs.db"
+LOGS_JSON_FILE = "logs.json"
+
+# Large fields (raw model output, fallback payloads) kept apart from the rest of a log record
+HEAVY_LOG_FIELDS = ("output", "data")
+# Fields that can be filtered on; each has an index together with the log id
+INDEXED_LOG_FIELDS = ("agent", "task", "level", "company")
+
+_current_company: ContextVar[Optional[str]] = ContextVar("current_company", default=None)
+
+
+def current_company() -> Optional[str]:
+    return _current_company.get()
+
+
+@contextmanager
+def log_company(company: str) -> Iterator[None]:
+    """Tag log records written in this context (and tasks started from it) with `company`."""
+    token = _current_company.set(company)
+    try:
+        yield
+    finally:
+        _current_company.reset(token)
+
+
+def logs_db_path(session_dir: str) -> str:
+    return os.path.join(session_dir, LOGS_DB_FILE)
+
+
+def empty_token_usage() -> Dict[str, Any]:
+    return {
+        'total_input_tokens': 0,
+        'total_output_tokens': 0,
+        'total_cost': 0.0,
+        'by_model': {},
+        'by_agent': {}
+    }
+
+
+def add_token_usage(token_usage: Dict[str, Any], log: Dict[str, Any]) -> None:
+    """Fold one log entry's tokens and cost into running totals, with the per model/agent breakdown."""
+    token_usage['total_input_tokens'] += log.get('input_tokens', 0)
+    token_usage['total_output_tokens'] += log.get('output_tokens', 0)
+    token_usage['total_cost'] += log.get('cost', 0.0)
+    for item in log.get('usage', []):
+        for group, key in (('by_model', item['model']), ('by_agent', item['agent'])):
+            totals = token_usage[group].setdefault(key, {'input_tokens': 0, 'output_tokens': 0, 'cost': 0.0})
+            totals['input_tokens'] += item.get('input_tokens', 0)
+            totals['output_tokens'] += item.get('output_tokens', 0)
+            totals['cost'] += item.get('cost', 0.0)
+
+
+class LogStore:
+    """SQLite copy of a session's log records, indexed for filtered, paginated reads.
+
+    Each record is split into the indexed fields, a summary (everything except
+    HEAVY_LOG_FIELDS) and the heavy payload, so queries that leave the payload
+    out never read raw model output. Token and cost totals are kept up to date
+    on every append, so they are never re-summed from the records. logs.json
+    stays the plain-text record.
+    """
+
+    def __init__(self, path: str, reset: bool = False) -> None:
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT,
+                level TEXT,
+                agent TEXT,
+                task TEXT,
+                company TEXT,
+                summary TEXT NOT NULL,
+                payload TEXT
+            )
+            """
+        )
+        for field in INDEXED_LOG_FIELDS:
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_logs_{field} ON logs ({field}, id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS token_usage (id INTEGER PRIMARY KEY CHECK (id = 1), totals TEXT NOT NULL)"
+        )
+        if reset:
+            self._conn.execute("DELETE FROM logs")
+            self._conn.execute("DELETE FROM token_usage")
+        if self._read_token_usage() is None:
+            # Stores written before totals were kept are summed once, from the summaries alone
+            totals = empty_token_usage()
+            for (summary,) in self._conn.execute("SELECT summary FROM logs ORDER BY id"):
+                add_token_usage(totals, json.loads(summary))
+            self._write_token_usage(totals)
+        self._conn.commit()
+
+    def _read_token_usage(self) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute("SELECT totals FROM token_usage WHERE id = 1").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write_token_usage(self, totals: Dict[str, Any]) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO token_usage (id, totals) VALUES (1, ?)", (json.dumps(totals),))
+
+    def last_id(self) -> int:
+        """Id of the newest record, 0 when the store is empty; a cursor for records written after it."""
+        return self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM logs").fetchone()[0]
+
+    def token_usage(self) -> Dict[str, Any]:
+        """Token and cost totals of every record appended so far."""
+        return self._read_token_usage() or empty_token_usage()
+
+    def append(self, records: List[Dict[str, Any]]) -> None:
+        rows = []
+        for record in records:
+            summary = {k: v for k, v in record.items() if k not in HEAVY_LOG_FIELDS}
+            payload = {k: record[k] for k in HEAVY_LOG_FIELDS if k in record}
+            rows.append((
+                record.get("timestamp"),
+                record.get("level"),
+                record.get("agent"),
+                record.get("task"),
+                record.get("company"),
+                json.dumps(summary, default=str),
+                json.dumps(payload, default=str) if payload else None
+            ))
+        totals = self.token_usage()
+        for record in records:
+            add_token_usage(totals, record)
+        self._conn.executemany(
+            "INSERT INTO logs (timestamp, level, agent, task, company, summary, payload) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        self._write_token_usage(totals)
+        self._conn.commit()
+
+    def import_json_lines(self, logs_path: str) -> int:
+        """Load a logs.json written before this store existed; returns records imported."""
+        records = []
+        with open(logs_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        self.append(records)
+        return len(records)
+
+    def query(
+        self,
+        agent: Optional[str] = None,
+        task: Optional[str] = None,
+        level: Optional[str] = None,
+        company: Optional[str] = None,
+        cursor: Optional[int] = None,
+        limit: int = 100,
+        include_payload: bool = False
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Return up to `limit` records after log id `cursor`, oldest first, and the next cursor.
+
+        The next cursor is None once there are no more matching records. Each
+        record carries its log `id`; heavy fields are included only when
+        `include_payload` is set.
+        """
+        conditions = ["id > ?"]
+        params: List[Any] = [cursor or 0]
+        for field, value in (("agent", agent), ("task", task), ("level", level), ("company", company)):
+            if value is not None:
+                conditions.append(f"{field} = ?")
+                params.append(value)
+        columns = "id, summary, payload" if include_payload else "id, summary, NULL"
+        limit = max(1, limit)
+        cursor_rows = self._conn.execute(
+            f"SELECT {columns} FROM logs WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+
+        records = []
+        for log_id, summary, payload in cursor_rows[:limit]:
+            record = json.loads(summary)
+            if payload:
+                record.update(json.loads(payload))
+            record["id"] = log_id
+            records.append(record)
+        next_cursor = records[-1]["id"] if len(cursor_rows) > limit else None
+        return records, next_cursor
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def open_log_store(session_dir: str) -> Optional[LogStore]:
+    """Open a session's log store for reading, building it from logs.json for older sessions."""
+    path = logs_db_path(session_dir)
+    if os.path.exists(path):
+        return LogStore(path)
+    logs_path = os.path.join(session_dir, LOGS_JSON_FILE)
+    if not os.path.exists(logs_path):
+        return None
+    store = LogStore(path)
+    store.import_json_lines(logs_path)
+    return store
+
+
+def clear_logs(session_dir: str) -> None:
+    for name in (LOGS_JSON_FILE, LOGS_DB_FILE, LOGS_DB_FILE + "-wal", LOGS_DB_FILE + "-shm"):
+        path = os.path.join(session_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class LogStoreHandler(logging.Handler):
+    """Logging handler that writes formatted JSON log records to a LogStore in batches.
+
+    `emit()` only buffers the record. The buffer is committed once it holds
+    `flush_records` records, and a background thread commits whatever is left
+    every `flush_interval` seconds, so a quiet job's records still show up.
+    `close()` commits the rest before closing the store.
+    """
+
+    def __init__(self, store: LogStore, flush_records: int = LOG_FLUSH_RECORDS, flush_interval: float = LOG_FLUSH_INTERVAL_SECONDS) -> None:
+        super().__init__()
+        self.store = store
+        self.flush_records = max(1, flush_records)
+        self.flush_interval = flush_interval
+        self._buffer: List[Dict[str, Any]] = []
+        self._stopped = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, name="log-store-flusher", daemon=True)
+        self._flusher.start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            entry = json.loads(self.format(record))
+        except Exception:
+            self.handleError(record)
+            return
+        with self.lock:
+            self._buffer.append(entry)
+            full = len(self._buffer) >= self.flush_records
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            records, self._buffer = self._buffer, []
+            if not records:
+                return
+            try:
+                self.store.append(records)
+            except Exception as e:
+                print(f"Could not write {len(records)} log records to {self.store.path}: {e}")
+
+    def _flush_periodically(self) -> None:
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._flusher.join()
+        try:
+            self.flush()
+            self.store.close()
+        finally:
+            super().close()
@@ -1,24 +1,28 @@
 import asyncio
 import json
 import os
-from pathlib import Path
-from typing import AsyncGenerator, Dict, Optional, Any
+from typing import AsyncGenerator, Dict, List, Optional, Any, Tuple
 
-import pandas as pd
 from dotenv import load_dotenv
 from google.adk.agents import BaseAgent, LlmAgent, SequentialAgent
 from google.adk.agents.invocation_context import InvocationContext
 from google.adk.events import Event
 from google.genai import types
 from typing_extensions import override
-from .sub_agents.agent import create_sequential_agent
-from .sub_agents.tools.read_google_docs import read_doc
-from .config import MAX_RETRIES, CSV_OUTPUT, BIZZZUP_DOCUMETS
-import re
+from .sub_agents.agent import create_sequential_agent, AGENT_FIELDS, STATE_QUALIFIED
+from .icp import document_hash, load_icp_profile
+from .config import MAX_RETRIES, CSV_OUTPUT, MAX_CONCURRENT_ROWS, PIPELINE_MODE, ENRICHMENT_CACHE_ENABLED, PERPLEXITY_HEDGE_AFTER_SECONDS, BIZZZUP_DOCUMETS, INGEST_PROGRESS_EVERY_ROWS
+from .cache import EnrichmentCache, normalize_domain, stale_fields
+from .json_extract import extract_json_object
+from .ingest import DuplicateCollapser, iter_input_rows, missing_input_columns, read_input_header
+from .rate_limiter import rate_limiter_stats
+from .results import ResultStore, ResultWriter, clear_results, results_csv_path, results_db_path
+from .checkpoint import write_checkpoint, clear_checkpoint
+from .events import EVENT_ROWS, EVENT_TOTAL, EventBusHandler, event_bus
+from .log_store import LogStore, LogStoreHandler, current_company, log_company, logs_db_path
 import logging
-import csv
-from .monitoring import create_log_entry, count_tokens
-from .sub_agents.tools.perplexity_tool import perplexity_research_tool, get_specific_info_tool
+from .monitoring import UsageTracker, create_log_entry, current_usage, track_usage
+from .sub_agents.tools.perplexity_tool import FIELD_PROMPTS, PerplexityResearchBatcher, close_perplexity_client
 
 # ──────────────────────────── ENV / LOGGING ──────────────────────────────
 load_dotenv()
@@ -26,7 +30,7 @@ module_logger = logging.getLogger(__name__)
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-def setup_logging(session_id: str) -> logging.Logger:
+def setup_logging(session_id: str, append: bool = False) -> logging.Logger:
     """Set up logging with a session-specific log file and return a new logger instance."""
     session_logger = logging.getLogger(f"{__name__}.{session_id}")
     session_logger.setLevel(logging.INFO)
@@ -43,9 +47,19 @@ def setup_logging(session_id: str) -> logging.Logger:
     os.makedirs(session_dir, exist_ok=True)
     log_file = os.path.join(session_dir, "logs.json")
 
-    fh = logging.FileHandler(log_file, mode='w')
+    fh = logging.FileHandler(log_file, mode='a' if append else 'w')
     fh.setFormatter(JsonFormatter())
     session_logger.addHandler(fh)
+
+    # Indexed copy for filtered, paginated log queries
+    store_handler = LogStoreHandler(LogStore(logs_db_path(session_dir), reset=not append))
+    store_handler.setFormatter(JsonFormatter())
+    session_logger.addHandler(store_handler)
+
+    # Live copy of each record for the web app, published after it is on disk
+    bus_handler = EventBusHandler(session_id)
+    bus_handler.setFormatter(JsonFormatter())
+    session_logger.addHandler(bus_handler)
     
     return session_logger
 
@@ -57,6 +71,9 @@ class JsonFormatter(logging.Formatter):
             "agent": getattr(record, 'agent', 'general'),
             "task": getattr(record, 'task', 'general_task')
         }
+        company = getattr(record, 'company', None) or current_company()
+        if company:
+            log_record["company"] = company
 
         if isinstance(record.msg, dict):
             log_record.update(record.msg)
@@ -76,6 +93,38 @@ def is_generic_email(email: str) -> bool:
     }
     return local_part in generic_prefixes or '+' in local_part
 
+def has_field_values(data: Dict[str, Any]) -> bool:
+    """True if at least one field of a research result holds a value."""
+    return any(value not in (None, "", [], {}) for value in data.values())
+
+def plan_fallback_fields(state: Dict[str, Any], agent_result_empty: bool = False) -> List[str]:
+    """Return the research fields the Perplexity fallback has to supply for a row.
+
+    The fallback only runs when the agents returned nothing or the CEO name or a
+    direct CEO email is missing; it then asks for every field that is empty in
+    state (a generic CEO inbox counts as empty). Otherwise nothing is planned.
+    """
+    missing = []
+    for field in FIELD_PROMPTS:
+        value = state.get(field)
+        if field == "ceo_email":
+            if is_generic_email(str(value or "").strip()):
+                missing.append(field)
+        elif not value or (isinstance(value, str) and not value.strip()):
+            missing.append(field)
+    if agent_result_empty or "ceo_name" in missing or "ceo_email" in missing:
+        return missing
+    return []
+
+def collect_llm_agents(agent: BaseAgent) -> List[LlmAgent]:
+    """Return the LlmAgent leaves of an agent tree in execution order."""
+    if isinstance(agent, LlmAgent):
+        return [agent]
+    llm_agents: List[LlmAgent] = []
+    for sub_agent in agent.sub_agents:
+        llm_agents.extend(collect_llm_agents(sub_agent))
+    return llm_agents
+
 def handle_final_response(event: Event, report_path: Optional[str] = None) -> None:
     """Handle the final response from an agent."""
     if not event.content or not event.content.parts:
@@ -95,8 +144,7 @@ APP_NAME = "company_info_scraper_app"
 USER_ID = "dev_user_01"
 SESSION_ID = "company_info_scraper_session"
 
-CSV_OUTPUT_COLS = ["Company Name", "Website", "CEO Name", "CEO Email", "Company Revenue", "Company Employee Count", "Company Founding Year", "Target Industries", "Target Company Size", "Target Geography", "Client Examples", "Service Focus", "Ranking", "Reasoning"]
-DOCUMENT_CONTENT = read_doc(BIZZZUP_DOCUMETS)
+CSV_OUTPUT_COLS = ["Row Index", "Company Name", "Website", "CEO Name", "CEO Email", "Company Revenue", "Company Employee Count", "Company Founding Year", "Target Industries", "Target Company Size", "Target Geography", "Client Examples", "Service Focus", "Ranking", "Reasoning", "Qualified"]
 KEY_TO_COLUMN_MAP = {   
     "ceo_name": "CEO Name",
     "ceo_email": "CEO Email", 
@@ -109,12 +157,17 @@ KEY_TO_COLUMN_MAP = {
     "client_examples": "Client Examples", 
     "service_focus": "Service Focus",
     "ranking": "Ranking",
-    "reasoning": "Reasoning"
+    "reasoning": "Reasoning",
+    "qualified": "Qualified"
 }
 
 # Session-state keys
 STATE_INPUT_FILE = "input_file"
 STATE_OUTPUT_FILE = "output_file"
+STATE_RESUME = "resume"
+STATE_ICP_DOCUMENT = "icp_document"
+STATE_ICP_HASH = "icp_hash"
+STATE_DOCUMENT_CONTENT = "document_content"
 
 # ─────────────────────── Agents for Company Research ──────────────────
 class CompanyInfoExtractorAgent(BaseAgent):
@@ -124,56 +177,152 @@ class CompanyInfoExtractorAgent(BaseAgent):
     
     sequential_agent: SequentialAgent
     _sub_agents_map: Dict[str, LlmAgent]
+    _refresh_pipelines: Dict[frozenset, SequentialAgent]
+    _research_batcher: PerplexityResearchBatcher
     logger: logging.Logger
+    max_concurrency: int = MAX_CONCURRENT_ROWS
+    pipeline_mode: str = PIPELINE_MODE
+    cache: Optional[EnrichmentCache] = None
+    refresh: bool = False
+    hedge_after: Optional[float] = PERPLEXITY_HEDGE_AFTER_SECONDS
     
-    def __init__(self, name: str, logger: Optional[logging.Logger] = None) -> None:
-        sequential_agent = create_sequential_agent()
+    def __init__(self, name: str, logger: Optional[logging.Logger] = None, max_concurrency: Optional[int] = None, pipeline_mode: Optional[str] = None, use_cache: Optional[bool] = None, refresh: bool = False, hedge_after: Optional[float] = PERPLEXITY_HEDGE_AFTER_SECONDS) -> None:
+        pipeline_mode = pipeline_mode or PIPELINE_MODE
+        sequential_agent = create_sequential_agent(pipeline_mode)
+        if use_cache is None:
+            use_cache = ENRICHMENT_CACHE_ENABLED
         
         super().__init__(
             name=name,
             sequential_agent=sequential_agent,
             sub_agents=[sequential_agent],
-            logger=logger or module_logger
+            logger=logger or module_logger,
+            max_concurrency=max(1, max_concurrency or MAX_CONCURRENT_ROWS),
+            pipeline_mode=pipeline_mode,
+            cache=EnrichmentCache() if use_cache or refresh else None,
+            refresh=refresh,
+            hedge_after=hedge_after
         )
         self._sub_agents_map = {
-            agent.name: agent for agent in self.sequential_agent.sub_agents
+            agent.name: agent for agent in collect_llm_agents(self.sequential_agent)
         }
-
-    @staticmethod
-    def _load_input(path: str) -> pd.DataFrame:
-        """Load input file (CSV or Excel)."""
-        ext = Path(path).suffix.lower()
-        if ext == ".csv":
-            return pd.read_csv(path)
-        if ext in {".xlsx", ".xls"}:
-            return pd.read_excel(path, engine="openpyxl")
-        raise ValueError(f"Unsupported file format: {ext}")
+        self._refresh_pipelines = {}
+        self._research_batcher = PerplexityResearchBatcher()
+
+    def _get_refresh_pipeline(self, agent_names: frozenset) -> SequentialAgent:
+        """Return (and memoize) a pipeline that only runs the given agents."""
+        if agent_names not in self._refresh_pipelines:
+            self._refresh_pipelines[agent_names] = create_sequential_agent(self.pipeline_mode, agent_names)
+        return self._refresh_pipelines[agent_names]
+
+    def _plan_refresh(self, website: str, icp_hash: str) -> Tuple[Dict[str, Any], Dict[str, Any], frozenset]:
+        """Return the stored field values, the fresh subset to keep, and the agents that must re-run.
+
+        RankingAgent depends on every other field and on the ICP, so it re-runs
+        whenever any researcher does or the stored ranking was made for another ICP.
+        """
+        records = self.cache.get_fields(website)
+        all_fields = [field for fields in AGENT_FIELDS.values() for field in fields]
+        stale = stale_fields(records, all_fields, icp_fields=AGENT_FIELDS["RankingAgent"], icp_hash=icp_hash)
+
+        stale_agents = {name for name, fields in AGENT_FIELDS.items() if stale.intersection(fields)}
+        if stale_agents:
+            stale_agents.add("RankingAgent")
+
+        stored_values = {field: record["value"] for field, record in records.items()}
+        fresh_values = {
+            field: stored_values[field]
+            for name, fields in AGENT_FIELDS.items() if name not in stale_agents
+            for field in fields if field in stored_values
+        }
+        return stored_values, fresh_values, frozenset(stale_agents)
 
     @staticmethod
     def _extract_json_from_text(text: str) -> Optional[Dict[str, Any]]:
         """Extract and parse the first JSON object found inside an arbitrary text blob."""
-        if not text:
+        try:
+            return extract_json_object(text)
+        except (json.JSONDecodeError, RecursionError):
             return None
 
-        code_block_match = re.search(r"```json\s*([\s\S]*?)```", text, re.IGNORECASE)
-        if code_block_match:
-            candidate = code_block_match.group(1).strip()
-        else:
-            brace_match = re.search(r"\{[\s\S]*?\}", text)
-            if not brace_match:
-                return None
-            candidate = brace_match.group(0).strip()
+    @staticmethod
+    async def _open_row_session(ctx: InvocationContext) -> InvocationContext:
+        """Create a short-lived session for one row and return a context bound to it.
+
+        Each row gets its own session in the session service, seeded with a copy of
+        the job-level state and only the user message that started the job. Rows
+        therefore never see each other's fields, and nothing a row writes outlives
+        it once `_close_row_session` deletes the session.
+        """
+        row_session = await ctx.session_service.create_session(
+            app_name=ctx.session.app_name,
+            user_id=ctx.session.user_id,
+            state=dict(ctx.session.state)
+        )
+        user_events = [event for event in ctx.session.events if event.author == "user"]
+        row_session.events = user_events[-1:]
+        return ctx.model_copy(update={"session": row_session})
 
-        try:
-            return json.loads(candidate)
-        except json.JSONDecodeError:
-            return None
+    @staticmethod
+    async def _close_row_session(row_ctx: InvocationContext) -> None:
+        """Delete a row's session, releasing its state and event history."""
+        row_session = row_ctx.session
+        row_session.events.clear()
+        row_session.state.clear()
+        await row_ctx.session_service.delete_session(
+            app_name=row_session.app_name,
+            user_id=row_session.user_id,
+            session_id=row_session.id
+        )
 
     async def _enrich_row(self, ctx: InvocationContext, company: str, website: str) -> Dict[str, Any]:
         """Process one company row through the agent pipeline."""
         if not website.startswith(("http://", "https://")):
             website = "https://" + website.lstrip("/")
 
+        default_data = {
+            "ceo_name": "",
+            "ceo_email": "",
+            "company_revenue": "",
+            "company_employee_count": "",
+            "company_founding_year": "",
+            "target_industries": "",
+            "target_company_size": "",
+            "target_geography": "",
+            "client_examples": "",
+            "service_focus": "",
+            "ranking": "",
+            "reasoning": ""
+        }
+
+        # Refresh mode re-runs only the agents whose fields are missing or stale and
+        # keeps the rest of the stored values.
+        pipeline = self.sequential_agent
+        stored_values: Dict[str, Any] = {}
+        fresh_values: Dict[str, Any] = {}
+        icp_hash = ctx.session.state.get(STATE_ICP_HASH) or ""
+        if self.refresh:
+            stored_values, fresh_values, stale_agents = self._plan_refresh(website, icp_hash)
+            self.logger.info({
+                'agent': self.name,
+                'task': f'Refresh plan for {company}',
+                'domain': normalize_domain(website),
+                'agents_to_run': sorted(stale_agents)
+            })
+            if not stale_agents:
+                return {**default_data, **stored_values}
+            if len(stale_agents) < len(AGENT_FIELDS):
+                pipeline = self._get_refresh_pipeline(stale_agents)
+        elif self.cache is not None:
+            cached = self.cache.get(website, icp_hash)
+            if cached is not None:
+                self.logger.info({
+                    'agent': self.name,
+                    'task': f'Cache hit for {company}',
+                    'domain': normalize_domain(website)
+                })
+                return cached
+
         initial_state = {
             "company_name": company,
             "website": website,
@@ -181,7 +330,6 @@ class CompanyInfoExtractorAgent(BaseAgent):
                 "name": company,
                 "website": website
             },
-            "document_content": DOCUMENT_CONTENT,
             "ceo_name": "",
             "ceo_email": "",
             "company_revenue": "",
@@ -195,117 +343,135 @@ class CompanyInfoExtractorAgent(BaseAgent):
             "ranking": "",
             "reasoning": ""
         }
+        initial_state.update(fresh_values)
         ctx.session.state.update(initial_state)
 
         model_name = "gemini-1.5-pro-preview-0409"
-        if hasattr(self, 'sequential_agent') and self.sequential_agent.sub_agents:
-            first_agent = self.sequential_agent.sub_agents[0]
-            if hasattr(first_agent, "model") and first_agent.model:
+        if self._sub_agents_map:
+            first_agent = next(iter(self._sub_agents_map.values()))
+            if first_agent.model:
                 model_name = first_agent.model
-        
-        initial_state_str = json.dumps(ctx.session.state)
-        prompt_tokens = count_tokens(initial_state_str, model_name=model_name)
 
         data: Optional[Dict[str, Any]] = None
-        for attempt in range(MAX_RETRIES):
-            try:
-                aggregated: Dict[str, Any] = {}
-                used_general_perplexity = False
-                used_specific_tool = False
+        field_sources: Dict[str, str] = {}
+        qualified: Optional[bool] = None
+        # Provider-reported usage of every model and Perplexity call made for this row
+        usage = UsageTracker()
+        with track_usage(usage):
+            for attempt in range(MAX_RETRIES):
+                try:
+                    aggregated: Dict[str, Any] = {}
+                    field_sources = {}
+                    used_general_perplexity = False
+                    used_specific_tool = False
+
+                    pipeline_task = asyncio.ensure_future(self._collect_pipeline_output(ctx, pipeline, aggregated, field_sources))
+                    hedge_task: Optional[asyncio.Future] = None
+                    if self.hedge_after is not None:
+                        await asyncio.wait({pipeline_task}, timeout=self.hedge_after)
+                        if not pipeline_task.done() and not aggregated:
+                            self.logger.info(f"No agent output for {company} after {self.hedge_after}s, starting hedged Perplexity request.", extra={'agent': self.name, 'task': 'perplexity_hedge'})
+                            hedge_task = asyncio.ensure_future(self._research_batcher.research(company, website))
+                            await asyncio.wait({pipeline_task, hedge_task}, return_when=asyncio.FIRST_COMPLETED)
+                            if (hedge_task.done() and not pipeline_task.done() and not hedge_task.exception()
+                                    and has_field_values(hedge_task.result())):
+                                # The fallback found data first; drop the slower pipeline and its partial output.
+                                # An empty answer (timeout, unparseable reply) leaves the pipeline running
+                                pipeline_task.cancel()
+                                await asyncio.gather(pipeline_task, return_exceptions=True)
+                                aggregated.clear()
+                                field_sources.clear()
+                                ctx.session.state.update({k: v for k, v in initial_state.items() if k in FIELD_PROMPTS})
+                                ctx.session.state.pop(STATE_QUALIFIED, None)
 
-                async for event in self.sequential_agent.run_async(ctx):
-                    if not (event.content and event.content.parts):
-                        continue
-
-                    agent = self._sub_agents_map.get(event.author)
-                    if not agent:
-                        continue
-                    
-                    text_content = ""
-                    for part in event.content.parts:
-                        text_content += getattr(part, "text", "")
-                    
-                    self.logger.info({
-                        "agent": agent.name,
-                        "task": f'Output for {ctx.session.state.get("company_name", "Unknown")}',
-                        "output": text_content,
-                    })
-
-                    parsed = self._extract_json_from_text(text_content)
-                    if parsed:
-                        cleaned_parsed = {k: "" if v is None else v for k, v in parsed.items()}
-                        if output_key := getattr(agent, "output_key", None):
-                            aggregated[output_key] = cleaned_parsed
-                        else:
-                            aggregated.update(cleaned_parsed)
-                        ctx.session.state.update(cleaned_parsed)
-
-                # Fallback to Perplexity tool if initial aggregation is empty
-                if not aggregated:
-                    self.logger.info(f"Initial agent response was empty for {company}, using Perplexity tool.", extra={'agent': self.name, 'task': 'perplexity_fallback'})
-                    perplexity_data = await perplexity_research_tool(company, website)
-                    cleaned_perplexity_data = {k: "" if v is None else v for k, v in perplexity_data.items()}
-                    aggregated.update(cleaned_perplexity_data)
-                    self.logger.info({
-                        'agent': self.name,
-                        'task': 'perplexity_research',
-                        'data': cleaned_perplexity_data
-                    })
-                    ctx.session.state.update(cleaned_perplexity_data)
-                    used_general_perplexity = True
-
-                # Targeted fallback: ensure CEO name and a non-generic CEO email are present
-                ceo_name_val = (ctx.session.state.get("ceo_name") or "").strip()
-                ceo_email_val = (ctx.session.state.get("ceo_email") or "").strip()
-                if (not ceo_name_val) or (not ceo_email_val) or is_generic_email(ceo_email_val):
                     try:
-                        ceo_specific = await get_specific_info_tool(company, website, ["ceo_name", "ceo_email"])
-                        ceo_specific = {k: "" if v is None else v for k, v in ceo_specific.items()}
-                        # Filter out generic inboxes if returned
-                        if is_generic_email(ceo_specific.get("ceo_email", "")):
-                            ceo_specific["ceo_email"] = ""
-                        if isinstance(aggregated.get("ceo_info"), dict):
-                            aggregated["ceo_info"].update(ceo_specific)
-                        else:
-                            aggregated["ceo_info"] = ceo_specific
-                        ctx.session.state.update(ceo_specific)
-                        self.logger.info({'agent': self.name, 'task': 'perplexity_ceo_specific', 'data': ceo_specific})
-                        used_specific_tool = True
-                    except Exception as e:
-                        self.logger.error(f"Error in targeted CEO fallback for '{company}': {e}", extra={'agent': self.name, 'task': 'perplexity_ceo_specific_error'})
-
-                ctx.session.state["aggregated_data"] = aggregated
-
-                aggregated_str = json.dumps(aggregated)
-                completion_tokens = count_tokens(aggregated_str, model_name=model_name)
+                        if not pipeline_task.cancelled():
+                            await pipeline_task
+                        if hedge_task is not None and aggregated:
+                            hedge_task.cancel()
+                            hedge_task = None
+                    except Exception:
+                        if hedge_task is None:
+                            raise
+                        self.logger.error(f"Agent pipeline failed for '{company}', using hedged Perplexity result.", extra={'agent': self.name, 'task': 'perplexity_hedge'})
+                    if hedge_task is not None and aggregated:
+                        # Partial agent output from a failed pipeline still beats the hedge
+                        hedge_task.cancel()
+                        hedge_task = None
+
+                    # Work out every field the fallback must supply and fetch them in one request
+                    # Companies that failed the qualification gate are written as-is, without paid fallbacks
+                    qualified = ctx.session.state.get(STATE_QUALIFIED)
+                    fallback_fields = plan_fallback_fields(ctx.session.state, agent_result_empty=not aggregated) if qualified is not False else []
+                    if fallback_fields and hedge_task is not None:
+                        # The hedged request already asked for every field; only what it missed is requested again
+                        self.logger.info(f"Initial agent response was empty for {company}, using hedged Perplexity result.", extra={'agent': self.name, 'task': 'perplexity_fallback'})
+                        perplexity_data = await hedge_task
+                        cleaned_perplexity_data = {k: "" if v is None else v for k, v in perplexity_data.items()}
+                        # Filter out generic inboxes so the follow-up below can replace them
+                        if is_generic_email(str(cleaned_perplexity_data.get("ceo_email", ""))):
+                            cleaned_perplexity_data["ceo_email"] = ""
+                        aggregated.update(cleaned_perplexity_data)
+                        self.logger.info({
+                            'agent': self.name,
+                            'task': 'perplexity_research',
+                            'data': cleaned_perplexity_data
+                        })
+                        ctx.session.state.update(cleaned_perplexity_data)
+                        field_sources.update({k: "Perplexity Research Tool" for k in cleaned_perplexity_data})
+                        used_general_perplexity = True
+                        fallback_fields = plan_fallback_fields(ctx.session.state)
+
+                    if fallback_fields:
+                        try:
+                            # Batched with the fallbacks of other rows in flight, each asking only for its own fields
+                            specific = await self._research_batcher.research(company, website, fallback_fields)
+                            specific = {k: "" if specific.get(k) is None else specific[k] for k in fallback_fields}
+                            # Filter out generic inboxes if returned
+                            if "ceo_email" in specific and is_generic_email(str(specific["ceo_email"])):
+                                specific["ceo_email"] = ""
+                            # Added last so it overrides the empty values of the agents' outputs when flattened
+                            aggregated["fallback_info"] = specific
+                            ctx.session.state.update(specific)
+                            field_sources.update({k: "Perplexity Specific Fields Tool" for k in specific})
+                            self.logger.info({'agent': self.name, 'task': 'perplexity_specific', 'data': specific})
+                            used_specific_tool = True
+                        except Exception as e:
+                            self.logger.error(f"Error in targeted Perplexity fallback for '{company}': {e}", extra={'agent': self.name, 'task': 'perplexity_specific_error'})
+
+                    ctx.session.state["aggregated_data"] = aggregated
+
+                    aggregated_str = json.dumps(aggregated)
+                    usage_entries = usage.entries()
                 
-                tools_used = [agent.name for agent in self.sequential_agent.sub_agents]
-                if used_general_perplexity:
-                    tools_used.append("Perplexity Research Tool")
-                if used_specific_tool:
-                    tools_used.append("Perplexity Specific Fields Tool")
+                    tools_used = [agent.name for agent in collect_llm_agents(pipeline)]
+                    if used_general_perplexity:
+                        tools_used.append("Perplexity Research Tool")
+                    if used_specific_tool:
+                        tools_used.append("Perplexity Specific Fields Tool")
                 
-                log_entry = create_log_entry(
-                    agent_name=self.name,
-                    task_description=f"Enriching company info for {company}",
-                    model_name=model_name,
-                    prompt_tokens=prompt_tokens,
-                    completion_tokens=completion_tokens,
-                    output=aggregated_str,
-                    tools_used=tools_used
-                )
-                self.logger.info(log_entry)
-
-                data = aggregated
-                break
-
-            except Exception as e:
-                self.logger.error(f"Error during enrichment attempt {attempt + 1} for '{company}': {e}", extra={'agent': self.name, 'task': 'enrichment_error'})
-
-                if attempt < MAX_RETRIES - 1:
-                    wait_time = 2 ** (attempt + 1)
-                    self.logger.info(f"Retrying in {wait_time} seconds...")
-                    await asyncio.sleep(wait_time)
+                    log_entry = create_log_entry(
+                        agent_name=self.name,
+                        task_description=f"Enriching company info for {company}",
+                        model_name=model_name,
+                        prompt_tokens=sum(item["input_tokens"] for item in usage_entries),
+                        completion_tokens=sum(item["output_tokens"] for item in usage_entries),
+                        output=aggregated_str,
+                        tools_used=tools_used,
+                        usage=usage_entries
+                    )
+                    self.logger.info(log_entry)
+
+                    data = aggregated
+                    break
+
+                except Exception as e:
+                    self.logger.error(f"Error during enrichment attempt {attempt + 1} for '{company}': {e}", extra={'agent': self.name, 'task': 'enrichment_error'})
+
+                    if attempt < MAX_RETRIES - 1:
+                        wait_time = 2 ** (attempt + 1)
+                        self.logger.info(f"Retrying in {wait_time} seconds...")
+                        await asyncio.sleep(wait_time)
 
         flat_data = {}
         if data:
@@ -318,28 +484,77 @@ class CompanyInfoExtractorAgent(BaseAgent):
                 if isinstance(agent_output, dict):
                     flat_data.update(agent_output)
 
-        default_data = {
-            "ceo_name": "",
-            "ceo_email": "",
-            "company_revenue": "",
-            "company_employee_count": "",
-            "company_founding_year": "",
-            "target_industries": "",
-            "target_company_size": "",
-            "target_geography": "",
-            "client_examples": "",
-            "service_focus": "",
-            "ranking": "",
-            "reasoning": ""
-        }
+        if flat_data and qualified is not None:
+            flat_data["qualified"] = "yes" if qualified else "no"
 
         if not flat_data:
-            return default_data
-
-        result = default_data.copy()
-        result.update({k: v for k, v in flat_data.items() if v is not None})
+            return {**default_data, **stored_values}
+
+        new_values = {k: v for k, v in flat_data.items() if v is not None}
+        if self.refresh:
+            # Fresh fields keep their stored value; stale ones are only replaced by a non-empty answer
+            new_values = {k: v for k, v in new_values.items() if v not in ("", [], {}) and k not in fresh_values}
+
+        result = {**default_data, **stored_values, **new_values}
+        if self.cache is not None:
+            # Unqualified rows are only partially researched and all-empty rows are failed
+            # lookups (timeouts, unparseable answers), so neither becomes a whole-entry hit
+            has_data = any(result.get(k) not in (None, "", [], {}) for k in default_data)
+            if result.get("qualified") != "no" and has_data:
+                self.cache.set(website, result, icp_hash=icp_hash)
+            self.cache.set_fields(
+                website,
+                {k: v for k, v in new_values.items() if k in default_data and v not in ("", [], {})},
+                field_sources,
+                icp_hash
+            )
         return result
 
+    async def _collect_pipeline_output(self, ctx: InvocationContext, pipeline: BaseAgent, aggregated: Dict[str, Any], field_sources: Dict[str, str]) -> None:
+        """Run the research pipeline for one row, merging each agent's JSON output into `aggregated`."""
+        usage = current_usage()
+        async for event in pipeline.run_async(ctx):
+            agent = self._sub_agents_map.get(event.author)
+            if agent and event.usage_metadata and usage is not None:
+                usage.add_genai_usage(agent.name, agent.model, event.usage_metadata)
+
+            if not (event.content and event.content.parts):
+                continue
+            if not agent:
+                continue
+            
+            text_content = ""
+            for part in event.content.parts:
+                text_content += getattr(part, "text", "")
+            
+            self.logger.info({
+                "agent": agent.name,
+                "task": f'Output for {ctx.session.state.get("company_name", "Unknown")}',
+                "output": text_content,
+            })
+
+            parsed = self._extract_json_from_text(text_content)
+            if parsed:
+                cleaned_parsed = {k: "" if v is None else v for k, v in parsed.items()}
+                if output_key := getattr(agent, "output_key", None):
+                    aggregated[output_key] = cleaned_parsed
+                else:
+                    aggregated.update(cleaned_parsed)
+                ctx.session.state.update(cleaned_parsed)
+                field_sources.update({k: agent.name for k in cleaned_parsed})
+
+    @staticmethod
+    def _build_output_row(idx: Any, company: str, website: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Map one enriched result onto the output columns."""
+        output_row = {
+            "Row Index": idx,
+            "Company Name": company,
+            "Website": website
+        }
+        for key, col_name in KEY_TO_COLUMN_MAP.items():
+            output_row[col_name] = str(result.get(key, "")) if result.get(key) is not None else ""
+        return output_row
+
     @override
     async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
         """Main execution flow."""
@@ -348,63 +563,201 @@ class CompanyInfoExtractorAgent(BaseAgent):
             yield Event(author=self.name, content=types.Content(parts=[types.Part(text="❌ No input file set")]))
             return
 
-        df = self._load_input(input_path)
-        for col in ["Company Name", "Website"]:
-            if col not in df.columns:
-                yield Event(author=self.name, content=types.Content(parts=[types.Part(text=f"❌ Missing column {col}")]))
-                return
+        # Only the header is read up front; rows are streamed to the workers below
+        for col in missing_input_columns(read_input_header(input_path)):
+            yield Event(author=self.name, content=types.Content(parts=[types.Part(text=f"❌ Missing column {col}")]))
+            return
+
+        # Rows copy the root session state, so they all see the distilled ICP profile
+        # and the hash that keys their cached rankings
+        icp_document = ctx.session.state.get(STATE_ICP_DOCUMENT)
+        ctx.session.state[STATE_ICP_HASH] = document_hash(icp_document or BIZZZUP_DOCUMETS)
+        icp_usage = UsageTracker()
+        with track_usage(icp_usage):
+            ctx.session.state[STATE_DOCUMENT_CONTENT] = await load_icp_profile(icp_document)
+        if icp_usage.records:
+            usage_entries = icp_usage.entries()
+            self.logger.info(create_log_entry(
+                agent_name="ICPProfile",
+                task_description="Distilling ICP profile",
+                model_name=usage_entries[0]["model"],
+                prompt_tokens=sum(item["input_tokens"] for item in usage_entries),
+                completion_tokens=sum(item["output_tokens"] for item in usage_entries),
+                output=ctx.session.state[STATE_DOCUMENT_CONTENT],
+                tools_used=[],
+                usage=usage_entries
+            ))
 
         session_id = ctx.session.id
         session_dir = os.path.join(BASE_DIR, "files", session_id)
-        output_path = os.path.join(session_dir, "companies.csv")
-
-        for idx, row in df.iterrows():
-            stop_flag_path = os.path.join(session_dir, 'stop')
+        output_path = results_db_path(session_dir)
+        stop_flag_path = os.path.join(session_dir, 'stop')
+
+        # Sessions started before the result store existed only have companies.csv
+        legacy_csv_path = results_csv_path(session_dir)
+        import_legacy_csv = not os.path.exists(output_path) and os.path.exists(legacy_csv_path)
+        store = ResultStore(output_path, CSV_OUTPUT_COLS)
+        if import_legacy_csv:
+            store.import_csv(legacy_csv_path)
+
+        # In resume mode, rows already persisted by an earlier run are skipped by
+        # input row index or website domain.
+        done_indices: set = set()
+        done_domains: set = set()
+        if ctx.session.state.get(STATE_RESUME):
+            done_indices, done_domains = store.completed_rows()
+            self.logger.info({
+                'agent': self.name,
+                'task': 'resume',
+                'completed_rows': len(done_indices),
+                'completed_domains': len(done_domains)
+            })
+        completed_count = len(done_indices)
+        write_checkpoint(session_dir, input_file=input_path, icp_document=icp_document, status="running", completed_rows=completed_count)
+
+        # Bounded worker pool: the producer feeds unique companies into a small queue
+        # and at most `max_concurrency` of them are enriched at once. Results are
+        # appended as soon as each company finishes, tagged with the original row index.
+        num_workers = self.max_concurrency
+        queue: asyncio.Queue = asyncio.Queue(maxsize=num_workers * 2)
+        stop_state = {"stopped": False}
+        collapser = DuplicateCollapser()
+
+        def stop_requested() -> bool:
+            if stop_state["stopped"]:
+                return True
             if os.path.exists(stop_flag_path):
+                stop_state["stopped"] = True
                 self.logger.info(f"Stop signal detected for session {session_id}. Stopping agent.", extra={'agent': self.name, 'task': 'stop_signal'})
-                break
+                return True
+            return False
+
+        def persist_row(idx: Any, company: str, website: str, result: Dict[str, Any]) -> None:
+            writer.write(self._build_output_row(idx, company, website, result))
+
+        def on_rows_flushed(rows: List[Dict[str, Any]]) -> None:
+            # Rows are on disk (fsynced) by now, so the checkpoint can safely count them
+            nonlocal completed_count
+            completed_count += len(rows)
+            write_checkpoint(session_dir, completed_rows=completed_count, last_row_index=str(rows[-1]["Row Index"]))
+            event_bus.publish(ctx.session.id, EVENT_ROWS, rows)
+            for row in rows:
+                self.logger.info(f"Row {row['Row Index']} ('{row['Company Name']}') enriched and saved.", extra={'agent': self.name, 'task': 'row_completed', 'company': row['Company Name']})
+
+        writer = ResultWriter(store, on_flush=on_rows_flushed)
+
+        async def produce_rows() -> None:
+            # The input is read once: rows are counted as they stream past, and the
+            # running count goes out with the progress events
+            rows_read = 0
+            try:
+                for idx, row in iter_input_rows(input_path):
+                    if stop_requested():
+                        break
 
-            company = str(row["Company Name"]).strip()
-            website = str(row["Website"]).strip()
+                    rows_read += 1
+                    if rows_read % INGEST_PROGRESS_EVERY_ROWS == 0:
+                        event_bus.publish(session_id, EVENT_TOTAL, {"total": rows_read, "final": False})
 
-            if not company or not website or pd.isna(company) or pd.isna(website):
-                continue
+                    company = row["Company Name"]
+                    website = row["Website"]
 
-            result = await self._enrich_row(ctx, company, website)
-            
-            output_row = {
-                "Company Name": company,
-                "Website": website
-            }
-            for key, col_name in KEY_TO_COLUMN_MAP.items():
-                output_row[col_name] = str(result.get(key, "")) if result.get(key) is not None else ""
+                    if not company or not website:
+                        continue
 
-            file_exists = os.path.exists(output_path)
+                    if str(idx) in done_indices or normalize_domain(website) in done_domains:
+                        continue
 
-            with open(output_path, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=CSV_OUTPUT_COLS)
-                if not file_exists:
-                    writer.writeheader()
-                writer.writerow(output_row)
+                    # Duplicates reuse the first row's enrichment: written now if it is
+                    # already done, otherwise by the worker once it finishes.
+                    group, is_new = collapser.add(idx, company, website)
+                    if not is_new:
+                        if group.result is not None:
+                            persist_row(idx, company, website, group.result)
+                        continue
+
+                    await queue.put(group)
+                else:
+                    write_checkpoint(session_dir, total_rows=rows_read)
+                    event_bus.publish(session_id, EVENT_TOTAL, {"total": rows_read, "final": True})
+            finally:
+                for _ in range(num_workers):
+                    await queue.put(None)
+
+        async def enrich_worker() -> None:
+            while True:
+                group = await queue.get()
+                if group is None:
+                    return
+                if stop_requested():
+                    continue
+
+                # Every log record written while enriching this row is tagged with its company
+                with log_company(group.company):
+                    row_ctx = await self._open_row_session(ctx)
+                    try:
+                        try:
+                            result = await self._enrich_row(row_ctx, group.company, group.website)
+                        except Exception as e:
+                            # The group's rows (and later duplicates) are still written, with empty fields
+                            self.logger.error(f"Unhandled error while enriching '{group.company}': {e}", extra={'agent': self.name, 'task': 'enrichment_error'})
+                            result = {}
+
+                        group.result = result
+                        for idx, company, website in group.members:
+                            persist_row(idx, company, website, result)
+                    finally:
+                        await self._close_row_session(row_ctx)
+
+        try:
+            async with writer:
+                await asyncio.gather(produce_rows(), *(enrich_worker() for _ in range(num_workers)))
+        finally:
+            store.close()
+        write_checkpoint(session_dir, status="stopped" if stop_state["stopped"] else "complete", completed_rows=completed_count)
+        if stop_state["stopped"] and os.path.exists(stop_flag_path):
+            # Every worker has wound down, so the stop request has been honoured
+            os.remove(stop_flag_path)
+
+        self.logger.info({
+            'agent': self.name,
+            'task': 'deduplication_stats',
+            'input_rows': collapser.total_rows,
+            'unique_companies': collapser.unique_companies,
+            'duplicate_rows': collapser.duplicate_rows
+        })
+
+        if self.cache is not None:
+            self.logger.info({
+                'agent': self.name,
+                'task': 'enrichment_cache_stats',
+                **self.cache.stats()
+            })
+
+        self.logger.info({
+            'agent': self.name,
+            'task': 'rate_limiter_stats',
+            'limiters': rate_limiter_stats()
+        })
 
         ctx.session.state[STATE_OUTPUT_FILE] = str(output_path)
 
         yield Event(
             author=self.name,
             content=types.Content(
-                parts=[types.Part(text=f"✅ Done – enriched file saved to {output_path}")]
+                parts=[types.Part(text=f"✅ Done – enriched results saved to {output_path}")]
             )
         )
 
 from google.adk.runners import Runner
 from google.adk.sessions import InMemorySessionService
 
-async def main(filepath: str, session_id: Optional[str] = None) -> None:
-    logger = setup_logging(session_id) if session_id else module_logger
+async def main(filepath: str, session_id: Optional[str] = None, max_concurrency: Optional[int] = None, pipeline_mode: Optional[str] = None, resume: bool = False, refresh: bool = False, icp_document: Optional[str] = None) -> None:
+    logger = setup_logging(session_id, append=resume) if session_id else module_logger
     adk_session_id = session_id or "default_session"
 
     sess_svc = InMemorySessionService()
-    agent = CompanyInfoExtractorAgent("CompanyInfoExtractor", logger=logger)
+    agent = CompanyInfoExtractorAgent("CompanyInfoExtractor", logger=logger, max_concurrency=max_concurrency, pipeline_mode=pipeline_mode, refresh=refresh)
     try:
         session_data = await sess_svc.get_session(
             app_name=APP_NAME,
@@ -415,35 +768,42 @@ async def main(filepath: str, session_id: Optional[str] = None) -> None:
             app_name=APP_NAME,
             user_id=USER_ID,
             session_id=adk_session_id,
-            state={STATE_INPUT_FILE: filepath}
+            state={STATE_INPUT_FILE: filepath, STATE_RESUME: resume, STATE_ICP_DOCUMENT: icp_document}
         )
     except:
         await sess_svc.create_session(
             app_name=APP_NAME,
             user_id=USER_ID,
             session_id=adk_session_id,
-            state={STATE_INPUT_FILE: filepath}
+            state={STATE_INPUT_FILE: filepath, STATE_RESUME: resume, STATE_ICP_DOCUMENT: icp_document}
         )
 
-    # Clear old files for this session before processing new one
+    # Clear old files for this session before processing new one, unless resuming
     session_dir = os.path.join(BASE_DIR, 'files', adk_session_id)
     os.makedirs(session_dir, exist_ok=True)
     
-    companies_path = os.path.join(session_dir, 'companies.csv')
-    if os.path.exists(companies_path):
-        os.remove(companies_path)
+    if not resume:
+        clear_results(session_dir)
+        clear_checkpoint(session_dir)
 
     runner = Runner(agent=agent, app_name=APP_NAME, session_service=sess_svc)
 
     start_message = types.Content(role="user", parts=[types.Part(text="Start")])
-    async for ev in runner.run_async(user_id=USER_ID, session_id=adk_session_id, new_message=start_message):
-        if ev.is_final_response() and ev.content:
-            pass
+    try:
+        async for ev in runner.run_async(user_id=USER_ID, session_id=adk_session_id, new_message=start_message):
+            if ev.is_final_response() and ev.content:
+                pass
+    finally:
+        # Release pooled Perplexity connections held for this job
+        await close_perplexity_client()
     
     logger.info("\n" + "="*50)
     logger.info("✅ Company data processing complete.")
-    logger.info(f"📄 Enriched data saved to: {companies_path}")
+    logger.info(f"📄 Enriched data saved to: {results_db_path(session_dir)}")
     logger.info("="*50 + "\n")
+    # Commit log records still buffered for the indexed log store
+    for handler in logger.handlers:
+        handler.flush()
 
-def run_agent_async(filepath: str, session_id: str):
-    asyncio.run(main(filepath, session_id))
\ No newline at end of file
+def run_agent_async(filepath: str, session_id: str, max_concurrency: Optional[int] = None, pipeline_mode: Optional[str] = None, resume: bool = False, refresh: bool = False, icp_document: Optional[str] = None):
+    asyncio.run(main(filepath, session_id, max_concurrency, pipeline_mode, resume, refresh, icp_document))
\ No newline at end of file
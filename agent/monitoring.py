@@ -1,8 +1,10 @@
 import json
 import os
 import tiktoken
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 from langchain_core.messages import BaseMessage
 from langchain_core.outputs import LLMResult
@@ -11,7 +13,7 @@ from google.cloud import aiplatform
 
 # from crewai import Crew
 # from crewai.task import Task, TaskOutput
-from .pricing import PRICING_DATA
+from .pricing import PRICING
 
 # Get the absolute path to the monitoring directory
 MONITORING_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -36,45 +38,98 @@ def count_tokens(string: str, model_name: str = "gpt-4") -> int:
     
     return len(encoding.encode(string))
 
-def _calculate_cost(model_name: str, prompt_tokens: int, completion_tokens: int) -> float:
+def _calculate_cost(model_name: str, prompt_tokens: int, completion_tokens: int, cached_input_tokens: int = 0) -> float:
     """Calculate the cost of a task based on token usage."""
     if not model_name:
         return 0.0
+    return PRICING.cost(model_name, prompt_tokens, completion_tokens, cached_input_tokens)
 
-    # Handle model names with prefixes
-    if '/' in model_name:
-        model_name = model_name.split('/')[-1]
+class UsageTracker:
+    """Provider-reported token usage for one unit of work, grouped by agent and model.
+
+    `input_tokens` includes any cached input tokens, which are also counted
+    separately in `cached_input_tokens`.
+    """
+
+    def __init__(self) -> None:
+        self.records: Dict[Tuple[str, str], Dict[str, float]] = {}
+
+    def add(self, agent: str, model: str, input_tokens: float = 0, output_tokens: float = 0, cached_input_tokens: float = 0, calls: float = 1) -> None:
+        if model and '/' in model:
+            model = model.split('/')[-1]
+        record = self.records.setdefault(
+            (agent, model or "unknown"),
+            {"input_tokens": 0, "cached_input_tokens": 0, "output_tokens": 0, "calls": 0}
+        )
+        record["input_tokens"] += input_tokens or 0
+        record["cached_input_tokens"] += cached_input_tokens or 0
+        record["output_tokens"] += output_tokens or 0
+        record["calls"] += calls
+
+    def add_genai_usage(self, agent: str, model: str, usage_metadata: Any) -> None:
+        """Record a Gemini `usage_metadata` block (search-grounding and thinking tokens included)."""
+        self.add(
+            agent,
+            model,
+            input_tokens=(usage_metadata.prompt_token_count or 0) + (usage_metadata.tool_use_prompt_token_count or 0),
+            cached_input_tokens=usage_metadata.cached_content_token_count or 0,
+            output_tokens=(usage_metadata.candidates_token_count or 0) + (usage_metadata.thoughts_token_count or 0)
+        )
+
+    def merge(self, other: "UsageTracker", share: float = 1.0) -> None:
+        """Add `share` of another tracker's usage, e.g. one row's part of a batched request."""
+        for (agent, model), record in other.records.items():
+            self.add(
+                agent,
+                model,
+                input_tokens=record["input_tokens"] * share,
+                cached_input_tokens=record["cached_input_tokens"] * share,
+                output_tokens=record["output_tokens"] * share,
+                calls=record["calls"] * share
+            )
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Per agent/model usage with its cost."""
+        entries = []
+        for (agent, model), record in self.records.items():
+            input_tokens = int(round(record["input_tokens"]))
+            cached_input_tokens = int(round(record["cached_input_tokens"]))
+            output_tokens = int(round(record["output_tokens"]))
+            entries.append({
+                "agent": agent,
+                "model": model,
+                "input_tokens": input_tokens,
+                "cached_input_tokens": cached_input_tokens,
+                "output_tokens": output_tokens,
+                "calls": round(record["calls"], 3),
+                "cost": _calculate_cost(model, input_tokens, output_tokens, cached_input_tokens)
+            })
+        return entries
+
+
+_current_usage: ContextVar[Optional[UsageTracker]] = ContextVar("current_usage", default=None)
+
+
+def current_usage() -> Optional[UsageTracker]:
+    return _current_usage.get()
+
+
+@contextmanager
+def track_usage(tracker: UsageTracker) -> Iterator[UsageTracker]:
+    """Attribute usage recorded in this context (and tasks started from it) to `tracker`."""
+    token = _current_usage.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current_usage.reset(token)
+
+
+def record_usage(agent: str, model: str, input_tokens: float = 0, output_tokens: float = 0, cached_input_tokens: float = 0) -> None:
+    """Add usage to the tracker of the current context, if there is one."""
+    tracker = _current_usage.get()
+    if tracker is not None:
+        tracker.add(agent, model, input_tokens, output_tokens, cached_input_tokens)
 
-    pricing = PRICING_DATA.get(model_name)
-    if not pricing:
-        # Fallback for models with date suffixes like 'gemini-1.5-pro-001'
-        base_model_name = '-'.join(model_name.split('-')[:-1])
-        if base_model_name:
-             pricing = PRICING_DATA.get(base_model_name)
-    
-    if not pricing:
-        # Fallback for models with more complex names like 'gemini-2.0-flash-lite'
-        parts = model_name.split('-')
-        for i in range(len(parts) - 1, 0, -1):
-            base_model_name = '-'.join(parts[:i])
-            if PRICING_DATA.get(base_model_name):
-                pricing = PRICING_DATA.get(base_model_name)
-                break
-
-    if not pricing:
-        print(f"Warning: Pricing data not found for model {model_name}. Cost will be 0.")
-        return 0.0
-        
-    input_cost = (prompt_tokens / 1_000_000) * pricing.get("input", 0.0)
-    output_cost = (completion_tokens / 1_000_000) * pricing.get("output", 0.0)
-    
-    # Handle cases where cached_input might not be in the pricing data or is None
-    cached_input_price = pricing.get("cached_input")
-    cached_input_cost = 0.0
-    if cached_input_price is not None:
-        cached_input_cost = (prompt_tokens / 1_000_000) * cached_input_price
-    
-    return input_cost + output_cost + cached_input_cost
 
 def create_log_entry(
     agent_name: str,
@@ -83,11 +138,19 @@ def create_log_entry(
     prompt_tokens: int,
     completion_tokens: int,
     output: str,
-    tools_used: List[str]
+    tools_used: List[str],
+    usage: Optional[List[Dict[str, Any]]] = None
 ) -> Dict[str, Any]:
-    """Creates a log entry dictionary for monitoring."""
-    cost = _calculate_cost(model_name, prompt_tokens, completion_tokens)
-    return {
+    """Creates a log entry dictionary for monitoring.
+
+    When a per agent/model `usage` breakdown is given, the entry's cost is the sum
+    of its parts so every model is priced at its own rate.
+    """
+    if usage is not None:
+        cost = sum(item["cost"] for item in usage)
+    else:
+        cost = _calculate_cost(model_name, prompt_tokens, completion_tokens)
+    entry = {
         "timestamp": datetime.now().isoformat(),
         "agent": agent_name,
         "task": task_description,
@@ -100,6 +163,9 @@ def create_log_entry(
         "total_tokens": prompt_tokens + completion_tokens,
         "cost": cost if cost is not None else 0.0,
     }
+    if usage is not None:
+        entry["usage"] = usage
+    return entry
 
 class CustomChatOpenAI(ChatOpenAI):
     """A custom wrapper for ChatOpenAI to track token usage."""
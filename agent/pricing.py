@@ -1,3 +1,7 @@
+import re
+import time
+from typing import Dict, Optional, Set, Tuple
+
 # All prices are per 1,000,000 tokens
 PRICING_DATA = {
     "gpt-4.1": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
@@ -58,5 +62,119 @@ PRICING_DATA = {
     "gemini-2.0-pro-exp-002": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
     "gemini-2.0-pro-exp-003": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
     "gemini-2.0-pro-exp-004": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
-    "gemini-2.0-flash-lite": {"input": 0.25, "output": 0.75}
-} 
\ No newline at end of file
+    "gemini-2.0-flash-lite": {"input": 0.25, "output": 0.75},
+    "sonar": {"input": 1.00, "output": 1.00}
+}
+
+# Explicit model-name aliases, checked before the suffix rules below
+MODEL_ALIASES = {
+    "gemini-2.0-flash-001": "gemini-2.0-flash",
+    "gemini-2.0-flash-lite-001": "gemini-2.0-flash-lite",
+    "gemini-1.5-flash-001": "gemini-1.5-flash",
+    "gemini-1.5-flash-002": "gemini-1.5-flash",
+    "gemini-1.5-flash-latest": "gemini-1.5-flash",
+    "gemini-1.5-pro-002": "gemini-1.5-pro",
+    "gemini-1.5-pro-preview-0514": "gemini-1.5-pro-preview-0409",
+    "chatgpt-4o-latest": "gpt-4o",
+}
+
+# Version suffixes stripped (one at a time, repeatedly) when a name has no exact price
+SUFFIX_RULES = [
+    re.compile(r"-\d{4}-\d{2}-\d{2}$"),   # gpt-4o-2024-08-06
+    re.compile(r"-\d{3,4}$"),              # gemini-1.0-pro-002, *-preview-0409
+    re.compile(r"-(latest|exp|preview)$"),
+]
+
+# (input, cached_input, output) in USD per 1,000,000 tokens
+Price = Tuple[float, Optional[float], float]
+
+_UNRESOLVED = object()
+
+
+class PricingResolver:
+    """Model-name to price lookups, compiled once from PRICING_DATA.
+
+    Names are normalized (provider prefix and case), then matched exactly, via
+    MODEL_ALIASES, or after stripping version suffixes. Every resolution,
+    including misses, is memoized, and each unknown model is reported once.
+    """
+
+    def __init__(self, pricing_data: Dict[str, Dict[str, Optional[float]]] = PRICING_DATA, aliases: Dict[str, str] = MODEL_ALIASES) -> None:
+        self._prices: Dict[str, Price] = {
+            name.lower(): (data.get("input") or 0.0, data.get("cached_input"), data.get("output") or 0.0)
+            for name, data in pricing_data.items()
+        }
+        self._aliases = {alias.lower(): target.lower() for alias, target in aliases.items()}
+        self._resolved: Dict[str, Optional[Price]] = {}
+        self._reported: Set[str] = set()
+
+    def _lookup(self, name: str) -> Optional[Price]:
+        while name:
+            name = self._aliases.get(name, name)
+            if name in self._prices:
+                return self._prices[name]
+            for rule in SUFFIX_RULES:
+                stripped = rule.sub("", name)
+                if stripped != name:
+                    name = stripped
+                    break
+            else:
+                return None
+        return None
+
+    def resolve(self, model_name: str) -> Optional[Price]:
+        """Return (input, cached_input, output) prices for a model, or None if unknown."""
+        try:
+            return self._resolved[model_name]
+        except KeyError:
+            pass
+        name = (model_name or "").strip().lower()
+        if "/" in name:
+            name = name.split("/")[-1]
+        price = self._lookup(name)
+        self._resolved[model_name] = price
+        if price is None and model_name not in self._reported:
+            self._reported.add(model_name)
+            print(f"Warning: Pricing data not found for model {model_name}. Cost will be 0.")
+        return price
+
+    def cost(self, model_name: str, input_tokens: float, output_tokens: float, cached_input_tokens: float = 0) -> float:
+        """USD cost of a call; `input_tokens` includes `cached_input_tokens`.
+
+        Cached tokens are billed at the cached-input rate when the model has one
+        and at the normal input rate otherwise.
+        """
+        price = self._resolved.get(model_name, _UNRESOLVED)
+        if price is _UNRESOLVED:
+            price = self.resolve(model_name)
+        if price is None:
+            return 0.0
+        input_price, cached_price, output_price = price
+        if not cached_input_tokens:
+            return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+        cached_input_tokens = min(cached_input_tokens, input_tokens)
+        if cached_price is None:
+            cached_price = input_price
+        return (
+            (input_tokens - cached_input_tokens) * input_price
+            + cached_input_tokens * cached_price
+            + output_tokens * output_price
+        ) / 1_000_000
+
+
+PRICING = PricingResolver()
+
+
+def benchmark(iterations: int = 200_000) -> Dict[str, float]:
+    """Time cost lookups the way per-event accounting issues them (repeated, mixed models)."""
+    models = ["gemini-2.0-flash", "models/gemini-1.5-pro-002", "gemini-2.0-flash-lite", "sonar", "gpt-4o-2024-08-06"]
+    resolver = PricingResolver()
+    start = time.perf_counter()
+    for i in range(iterations):
+        resolver.cost(models[i % len(models)], 1200, 150, 100)
+    elapsed = time.perf_counter() - start
+    return {"iterations": iterations, "seconds": round(elapsed, 4), "ns_per_call": round(elapsed / iterations * 1e9, 1)}
+
+
+if __name__ == "__main__":
+    print(benchmark())
@@ -0,0 +1,172 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from .config import RATE_LIMITS, RATE_LIMIT_DB_PATH
+
+
+class TokenBucketRateLimiter:
+    """Requests-per-minute and tokens-per-minute budget for one provider/model.
+
+    Callers reserve capacity up front and the bucket is allowed to go negative, so
+    every caller is told exactly how long to wait and later callers queue behind
+    earlier ones instead of failing. When `db_path` is set the bucket state lives in
+    SQLite and is shared by every process using the same file.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float,
+        tokens_per_minute: Optional[float] = None,
+        db_path: Optional[str] = None
+    ) -> None:
+        self.name = name
+        self.requests_per_minute = float(requests_per_minute)
+        self.tokens_per_minute = float(tokens_per_minute) if tokens_per_minute else None
+        self.db_path = db_path
+
+        self._lock = threading.Lock()
+        self._requests = self.requests_per_minute
+        self._tokens = self.tokens_per_minute or 0.0
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+
+        self.queue_depth = 0
+        self.total_requests = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                        name TEXT PRIMARY KEY,
+                        requests REAL NOT NULL,
+                        tokens REAL NOT NULL,
+                        updated_at REAL NOT NULL,
+                        paused_until REAL NOT NULL
+                    )
+                    """
+                )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def _refill(self, requests: float, tokens: float, elapsed: float) -> Tuple[float, float]:
+        requests = min(self.requests_per_minute, requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            tokens = min(self.tokens_per_minute, tokens + elapsed * self.tokens_per_minute / 60)
+        return requests, tokens
+
+    def _debit(self, requests: float, tokens: float, cost: int, now: float, paused_until: float) -> Tuple[float, float, float]:
+        """Take one request and `cost` tokens from the bucket and return the wait needed."""
+        requests -= 1
+        wait = max(0.0, -requests * 60 / self.requests_per_minute)
+        if self.tokens_per_minute:
+            tokens -= min(cost, self.tokens_per_minute)
+            wait = max(wait, -tokens * 60 / self.tokens_per_minute)
+        return requests, tokens, max(wait, paused_until - now)
+
+    def _reserve(self, cost: int) -> float:
+        if self.db_path:
+            return self._reserve_shared(cost)
+        with self._lock:
+            now = time.monotonic()
+            self._requests, self._tokens = self._refill(self._requests, self._tokens, now - self._updated_at)
+            self._updated_at = now
+            self._requests, self._tokens, wait = self._debit(self._requests, self._tokens, cost, now, self._paused_until)
+            return wait
+
+    def _reserve_shared(self, cost: int) -> float:
+        # Wall-clock time, since monotonic clocks are not comparable across processes
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = conn.execute(
+                "SELECT requests, tokens, updated_at, paused_until FROM rate_limit_buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            if row is None:
+                requests, tokens, paused_until = self.requests_per_minute, self.tokens_per_minute or 0.0, 0.0
+            else:
+                requests, tokens, updated_at, paused_until = row
+                requests, tokens = self._refill(requests, tokens, max(0.0, now - updated_at))
+            requests, tokens, wait = self._debit(requests, tokens, cost, now, paused_until)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limit_buckets (name, requests, tokens, updated_at, paused_until) VALUES (?, ?, ?, ?, ?)",
+                (self.name, requests, tokens, now, paused_until)
+            )
+            conn.execute("COMMIT")
+            return wait
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """Wait until a request of roughly `tokens` tokens fits the budget; return the seconds waited."""
+        wait = self._reserve(max(0, int(tokens)))
+        self.total_requests += 1
+        self.last_wait = wait
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        if wait > 0:
+            self.queue_depth += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self.queue_depth -= 1
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller back for `seconds`, e.g. after a 429 with a Retry-After header."""
+        if self.db_path:
+            with self._lock, self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                until = time.time() + seconds
+                conn.execute(
+                    "UPDATE rate_limit_buckets SET paused_until = MAX(paused_until, ?) WHERE name = ?", (until, self.name)
+                )
+                conn.execute("COMMIT")
+            return
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "queue_depth": self.queue_depth,
+            "total_requests": self.total_requests,
+            "total_wait_seconds": round(self.total_wait, 3),
+            "max_wait_seconds": round(self.max_wait, 3),
+            "last_wait_seconds": round(self.last_wait, 3)
+        }
+
+
+_limiters: Dict[str, TokenBucketRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, model: str) -> TokenBucketRateLimiter:
+    """Return the process-wide limiter for a provider/model, creating it from RATE_LIMITS."""
+    if "/" in model:
+        model = model.split("/")[-1]
+    name = f"{provider}:{model}"
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            provider_limits = RATE_LIMITS.get(provider, {})
+            limits = provider_limits.get(model) or provider_limits.get("default") or {"rpm": 60}
+            limiter = TokenBucketRateLimiter(name, limits["rpm"], limits.get("tpm"), RATE_LIMIT_DB_PATH)
+            _limiters[name] = limiter
+        return limiter
+
+
+def rate_limiter_stats() -> Dict[str, Dict[str, Any]]:
+    """Current queue depth and wait statistics for every limiter in this process."""
+    with _limiters_lock:
+        return {name: limiter.stats() for name, limiter in _limiters.items()}
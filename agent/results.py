@@ -0,0 +1,333 @@
+import asyncio
+import csv
+import os
+import sqlite3
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from .cache import normalize_domain
+from .checkpoint import repair_partial_tail
+from .config import RESULT_FLUSH_ROWS, RESULT_FLUSH_INTERVAL_SECONDS
+from .sub_agents.agent import parse_score
+
+RESULTS_DB_FILE = "results.db"
+RESULTS_CSV_FILE = "companies.csv"
+
+# Column affinities; every other column is stored as TEXT
+COLUMN_TYPES = {"Row Index": "INTEGER"}
+# Ranking keeps the model's text ("8/10"); its parsed score lives in this hidden, indexed
+# column and is what paginated queries sort and filter on
+SCORE_COLUMN = "_ranking_score"
+# Columns matched by a paginated query's text search
+SEARCH_COLUMNS = ["Company Name", "Website", "CEO Name", "CEO Email"]
+
+
+def results_db_path(session_dir: str) -> str:
+    return os.path.join(session_dir, RESULTS_DB_FILE)
+
+
+def results_csv_path(session_dir: str) -> str:
+    return os.path.join(session_dir, RESULTS_CSV_FILE)
+
+
+def _quote(column: str) -> str:
+    return '"' + column.replace('"', '""') + '"'
+
+
+class ResultStore:
+    """Typed, append-only SQLite table of a session's enriched rows.
+
+    Each output column is a real table column, so readers can load just the
+    columns they need instead of re-parsing the whole CSV. The database runs in WAL
+    mode: the agent appends while the web app reads without blocking it.
+    """
+
+    def __init__(self, path: str, columns: Optional[List[str]] = None) -> None:
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        if columns:
+            column_defs = ", ".join(f"{_quote(col)} {COLUMN_TYPES.get(col, 'TEXT')}" for col in columns)
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS companies (_id INTEGER PRIMARY KEY AUTOINCREMENT, {column_defs})")
+            self._conn.commit()
+        table_columns = [row[1] for row in self._conn.execute("PRAGMA table_info(companies)")]
+        self.columns = [col for col in table_columns if not col.startswith("_")]
+        self.has_score = "Ranking" in self.columns
+        if self.has_score and SCORE_COLUMN not in table_columns:
+            self._add_score_column()
+
+    def _add_score_column(self) -> None:
+        """Add the parsed ranking score to a store, backfilling rows written before it existed."""
+        self._conn.execute(f"ALTER TABLE companies ADD COLUMN {SCORE_COLUMN} REAL")
+        self._conn.executemany(
+            f"UPDATE companies SET {SCORE_COLUMN} = ? WHERE _id = ?",
+            [(parse_score(ranking), row_id) for row_id, ranking in self._conn.execute('SELECT _id, "Ranking" FROM companies').fetchall()]
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_ranking_score ON companies ({SCORE_COLUMN})")
+        self._conn.commit()
+
+    @staticmethod
+    def _value(column: str, value: Any) -> Any:
+        # Missing numbers are stored as NULL so they stay out of numeric sorts and ranges
+        if value == "" and column in COLUMN_TYPES:
+            return None
+        return value
+
+    def append(self, rows: List[Dict[str, Any]]) -> None:
+        """Insert rows in one transaction; they are durable once this returns."""
+        if not rows:
+            return
+        names = [_quote(col) for col in self.columns] + ([SCORE_COLUMN] if self.has_score else [])
+        self._conn.executemany(
+            f"INSERT INTO companies ({', '.join(names)}) VALUES ({', '.join('?' for _ in names)})",
+            [
+                tuple(self._value(col, row.get(col, "")) for col in self.columns)
+                + ((parse_score(row.get("Ranking")),) if self.has_score else ())
+                for row in rows
+            ]
+        )
+        self._conn.commit()
+
+    def count(self) -> int:
+        if not self.columns:
+            return 0
+        return self._conn.execute("SELECT COUNT(*) FROM companies").fetchone()[0]
+
+    def read_rows(self, columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Return every stored row (in write order) restricted to `columns`."""
+        columns = [col for col in (columns or self.columns) if col in self.columns]
+        if not columns:
+            return []
+        cursor = self._conn.execute(f"SELECT {', '.join(_quote(col) for col in columns)} FROM companies ORDER BY _id")
+        return [
+            {col: "" if value is None else value for col, value in zip(columns, row)}
+            for row in cursor
+        ]
+
+    def query(
+        self,
+        page: int = 1,
+        page_size: int = 50,
+        sort: Optional[str] = None,
+        descending: bool = False,
+        min_ranking: Optional[float] = None,
+        max_ranking: Optional[float] = None,
+        search: Optional[str] = None,
+        columns: Optional[List[str]] = None
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """Return one page of rows and the number of rows matching the filters.
+
+        Rows are in write order unless `sort` names a column; rows without a
+        value sort last in either direction. Ranking sorts and the ranking range
+        use the parsed score, so the range only matches rows with a score, and
+        `search` is a case-insensitive substring match over SEARCH_COLUMNS.
+        Raises ValueError for an unknown sort column.
+        """
+        columns = [col for col in (columns or self.columns) if col in self.columns]
+        if not columns:
+            return [], 0
+        if sort is not None and sort not in self.columns:
+            raise ValueError(f"Unknown sort column: {sort}")
+
+        conditions: List[str] = []
+        params: List[Any] = []
+        if self.has_score and (min_ranking is not None or max_ranking is not None):
+            conditions.append(f"{SCORE_COLUMN} BETWEEN ? AND ?")
+            params.extend([
+                float("-inf") if min_ranking is None else min_ranking,
+                float("inf") if max_ranking is None else max_ranking
+            ])
+        search_columns = [col for col in SEARCH_COLUMNS if col in self.columns]
+        if search and search_columns:
+            pattern = "%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            conditions.append("(" + " OR ".join(f"{_quote(col)} LIKE ? ESCAPE '\\'" for col in search_columns) + ")")
+            params.extend([pattern] * len(search_columns))
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        direction = "DESC" if descending else "ASC"
+        if sort is None:
+            order_by = f"_id {direction}"
+        elif sort == "Ranking" and self.has_score:
+            order_by = f"{SCORE_COLUMN} {direction} NULLS LAST, _id"
+        else:
+            order_by = f"{_quote(sort)} {direction} NULLS LAST, _id"
+
+        total = self._conn.execute(f"SELECT COUNT(*) FROM companies{where}", params).fetchone()[0]
+        page_size = max(1, page_size)
+        cursor = self._conn.execute(
+            f"SELECT {', '.join(_quote(col) for col in columns)} FROM companies{where} ORDER BY {order_by} LIMIT ? OFFSET ?",
+            params + [page_size, (max(1, page) - 1) * page_size]
+        )
+        rows = [
+            {col: "" if value is None else value for col, value in zip(columns, row)}
+            for row in cursor
+        ]
+        return rows, total
+
+    def read_frame(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        columns = [col for col in (columns or self.columns) if col in self.columns]
+        return pd.DataFrame(self.read_rows(columns), columns=columns)
+
+    def completed_rows(self) -> Tuple[Set[str], Set[str]]:
+        """Return the input row indices and website domains already stored."""
+        indices: Set[str] = set()
+        domains: Set[str] = set()
+        for row in self.read_rows(["Row Index", "Website"]):
+            if row["Row Index"] != "":
+                indices.add(str(row["Row Index"]))
+            domain = normalize_domain(str(row["Website"]))
+            if domain:
+                domains.add(domain)
+        return indices, domains
+
+    def import_csv(self, csv_path: str) -> int:
+        """Load rows from a companies.csv written by an older run; returns rows imported."""
+        repair_partial_tail(csv_path)
+        with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        self.append(rows)
+        return len(rows)
+
+    def export_csv(self, csv_path: str) -> str:
+        """Write the stored rows to a CSV file (atomically) and return its path."""
+        tmp_path = csv_path + ".tmp"
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=self.columns)
+            writer.writeheader()
+            writer.writerows(self.read_rows())
+        os.replace(tmp_path, csv_path)
+        return csv_path
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def open_result_store(session_dir: str) -> Optional[ResultStore]:
+    """Open a session's result store for reading, or return None if nothing was stored yet."""
+    path = results_db_path(session_dir)
+    if not os.path.exists(path):
+        return None
+    return ResultStore(path)
+
+
+def read_results(session_dir: str, columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    store = open_result_store(session_dir)
+    if store is None:
+        return []
+    try:
+        return store.read_rows(columns)
+    finally:
+        store.close()
+
+
+def export_results_csv(session_dir: str) -> Optional[str]:
+    """Generate companies.csv from the result store; returns None if there are no results."""
+    store = open_result_store(session_dir)
+    if store is None:
+        return None
+    try:
+        return store.export_csv(results_csv_path(session_dir))
+    finally:
+        store.close()
+
+
+def clear_results(session_dir: str) -> None:
+    for name in (RESULTS_DB_FILE, RESULTS_DB_FILE + "-wal", RESULTS_DB_FILE + "-shm", RESULTS_CSV_FILE):
+        path = os.path.join(session_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class ResultWriter:
+    """Append enriched rows to the session's ResultStore from one writer task.
+
+    Row tasks hand finished rows to `write()`, which only enqueues them. A single
+    task drains the queue, commits rows in batches of `flush_rows` or every
+    `flush_interval` seconds, and calls `on_flush` with the rows that are now
+    durable, so checkpoints never get ahead of the store.
+    """
+
+    def __init__(
+        self,
+        store: ResultStore,
+        flush_rows: int = RESULT_FLUSH_ROWS,
+        flush_interval: float = RESULT_FLUSH_INTERVAL_SECONDS,
+        on_flush: Optional[Callable[[List[Dict[str, Any]]], None]] = None
+    ) -> None:
+        self.store = store
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.rows_written = 0
+        self.flushes = 0
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._buffer: List[Dict[str, Any]] = []
+
+    async def __aenter__(self) -> "ResultWriter":
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    def write(self, row: Dict[str, Any]) -> None:
+        """Queue a row for the writer task; never blocks the calling row task."""
+        if self._task is None:
+            raise RuntimeError("ResultWriter has not been started")
+        if self._task.done():
+            # Surface a failed writer instead of silently dropping rows
+            self._task.result()
+            raise RuntimeError("ResultWriter is closed")
+        self._queue.put_nowait(row)
+
+    async def close(self) -> None:
+        """Commit everything still queued, then stop the writer task."""
+        if self._task is None:
+            return
+        try:
+            if not self._task.done():
+                self._queue.put_nowait(None)
+            await self._task
+        finally:
+            self._task = None
+
+    async def _run(self) -> None:
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                row = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                self._flush()
+                deadline = None
+                continue
+
+            if row is None:
+                self._flush()
+                return
+
+            self._buffer.append(row)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            if len(self._buffer) >= self.flush_rows:
+                self._flush()
+                deadline = None
+
+    def _flush(self) -> None:
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        self.store.append(rows)
+        self.rows_written += len(rows)
+        self.flushes += 1
+        if self.on_flush is not None:
+            self.on_flush(rows)
@@ -1,5 +1,16 @@
-from google.adk.agents import LlmAgent, SequentialAgent, Agent
+import re
+from typing import AsyncGenerator, Collection, Optional
+
+from google.adk.agents import BaseAgent, LlmAgent, SequentialAgent, ParallelAgent, Agent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.adk.models import LlmRequest
 from google.adk.tools import google_search
+from typing_extensions import override
+
+from ..config import QUALIFICATION_SCORE_THRESHOLD
+from ..rate_limiter import get_rate_limiter
 
 
 GEMINI_MODEL = "gemini-2.0-flash"
@@ -8,11 +19,117 @@ GEMINI_MODEL_3 = "gemini-2.0-flash-lite"
 
 
 
-def create_sequential_agent() -> SequentialAgent:
-    """Creates and returns a new instance of the sequential agent."""
+def _estimate_request_tokens(llm_request: LlmRequest) -> int:
+    """Rough token estimate (~4 characters per token) of a model request."""
+    chars = 0
+    system_instruction = llm_request.config.system_instruction if llm_request.config else None
+    if isinstance(system_instruction, str):
+        chars += len(system_instruction)
+    for content in llm_request.contents or []:
+        for part in content.parts or []:
+            chars += len(part.text or "")
+    return chars // 4
+
+
+async def rate_limit_model_call(callback_context: CallbackContext, llm_request: LlmRequest) -> None:
+    """Queue every Gemini call behind the shared per-model rate limiter."""
+    model = llm_request.model or GEMINI_MODEL
+    await get_rate_limiter("gemini", model).acquire(_estimate_request_tokens(llm_request))
+    return None
+
+
+PIPELINE_MODES = ("sequential", "parallel", "gated")
+
+# Session-state key the gated pipeline sets to True/False once a row has been qualified
+STATE_QUALIFIED = "qualified"
+
+
+_OUT_OF_TEN = re.compile(r"(\d+(?:\.\d+)?)\s*/\s*10(?![\d.])")
+_NUMBER = re.compile(r"(?<![\d.])\d+(?:\.\d+)?")
+
+
+def parse_score(value) -> Optional[float]:
+    """Pull the 0-10 score out of a ranking value such as 7, "7", "7/10" or "Tier 1, 8/10".
+
+    An "N/10" match wins over any other number; otherwise the first number in
+    the 0-10 range is used. Returns None when there is no such score.
+    """
+    text = str(value if value is not None else "")
+    match = _OUT_OF_TEN.search(text)
+    candidates = [match.group(1)] if match else _NUMBER.findall(text)
+    for candidate in candidates:
+        score = float(candidate)
+        if 0 <= score <= 10:
+            return score
+    return None
+
+
+class QualificationGate(BaseAgent):
+    """Run a cheap qualification pass and only deep-research companies that pass it.
+
+    The qualification agent's JSON output is expected in session state by the time
+    it finishes (the caller merges each event's JSON into state as it streams).
+    Rows without a parseable score are treated as qualified so nothing is dropped
+    silently.
+    """
+
+    qualification: BaseAgent
+    deep_research: BaseAgent
+    threshold: float = QUALIFICATION_SCORE_THRESHOLD
+
+    def __init__(self, name: str, qualification: BaseAgent, deep_research: BaseAgent, threshold: float = QUALIFICATION_SCORE_THRESHOLD) -> None:
+        super().__init__(
+            name=name,
+            qualification=qualification,
+            deep_research=deep_research,
+            threshold=threshold,
+            sub_agents=[qualification, deep_research]
+        )
+
+    @override
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        async for event in self.qualification.run_async(ctx):
+            yield event
+
+        score = parse_score(ctx.session.state.get("ranking"))
+        qualified = score is None or score >= self.threshold
+        ctx.session.state[STATE_QUALIFIED] = qualified
+        if not qualified:
+            return
+
+        async for event in self.deep_research.run_async(ctx):
+            yield event
+
+# Output fields produced by each research agent
+AGENT_FIELDS = {
+    "CEOResearcher": ["ceo_name", "ceo_email"],
+    "RevenueResearcher": ["company_revenue"],
+    "CompanyStatsResearcher": ["company_employee_count", "company_founding_year"],
+    "ClientTargetAgent": ["target_industries", "target_company_size", "target_geography", "client_examples", "service_focus"],
+    "RankingAgent": ["ranking", "reasoning"]
+}
+
+
+def create_sequential_agent(mode: str = "sequential", agent_names: Optional[Collection[str]] = None) -> SequentialAgent:
+    """Creates and returns a new instance of the company research pipeline.
+
+    In "sequential" mode every agent runs one after another. In "parallel" mode the
+    four researchers do not depend on each other, so they run concurrently and only
+    the RankingAgent waits for all of them. In "gated" mode ClientTargetAgent and a
+    lightweight QualificationAgent score the company first, and the CEO, revenue and
+    stats researchers plus the full RankingAgent only run when that score reaches
+    QUALIFICATION_SCORE_THRESHOLD. `agent_names` restricts the pipeline to a subset
+    of agents, e.g. when refreshing only stale fields; subsets are never gated.
+    """
+    if mode not in PIPELINE_MODES:
+        raise ValueError(f"Unsupported pipeline mode: {mode}")
+    if mode == "gated" and agent_names is not None:
+        mode = "parallel"
+
     ceo_researcher = LlmAgent(
         name="CEOResearcher",
         model=GEMINI_MODEL,
+        before_model_callback=rate_limit_model_call,
         tools=[google_search],
         instruction="""
     You are a meticulous corporate researcher. Research the company: {company_name}.
@@ -56,6 +173,7 @@ def create_sequential_agent() -> SequentialAgent:
     revenue_researcher = LlmAgent(
         name="RevenueResearcher", 
         model=GEMINI_MODEL,
+        before_model_callback=rate_limit_model_call,
         tools=[google_search],
         instruction="""
     You are a meticulous corporate researcher. Your task is to deeply research the company: {company_name} and find accurate revenue information.
@@ -125,6 +243,7 @@ def create_sequential_agent() -> SequentialAgent:
     company_stats_researcher = LlmAgent(
         name="CompanyStatsResearcher",
         model=GEMINI_MODEL,
+        before_model_callback=rate_limit_model_call,
         tools=[google_search],
         instruction="""
     You are a meticulous corporate researcher. Your task is to deeply research the company: {company_name} and find accurate employee count and founding information.
@@ -182,6 +301,7 @@ def create_sequential_agent() -> SequentialAgent:
     client_target_agent = LlmAgent(
         name="ClientTargetAgent",
         model=GEMINI_MODEL,
+        before_model_callback=rate_limit_model_call,
         tools=[google_search],
         include_contents='none',
         instruction="""
@@ -223,6 +343,7 @@ def create_sequential_agent() -> SequentialAgent:
     ranking_agent = LlmAgent(
         name="RankingAgent",
         model=GEMINI_MODEL_2,
+        before_model_callback=rate_limit_model_call,
         tools=[google_search],
         include_contents='none',
         instruction="""
@@ -275,15 +396,77 @@ def create_sequential_agent() -> SequentialAgent:
         output_key="ranking"
     )
 
+    if mode == "gated":
+        qualification_agent = LlmAgent(
+            name="QualificationAgent",
+            model=GEMINI_MODEL_3,
+            before_model_callback=rate_limit_model_call,
+            include_contents='none',
+            instruction="""
+    You are a lead qualification agent. Quickly judge whether the target company is worth
+    researching further as a collaboration partner for your company.
+
+    1. Your company (described in {document_content})
+    2. The target company: {company_name}
+
+    What we know about the target company:
+    - Target Industries: {target_industries}
+    - Target Company Size: {target_company_size}
+    - Target Geography: {target_geography}
+    - Client Examples: {client_examples}
+    - Service Focus: {service_focus}
+
+    Compare this against your company's ideal customer profile and return:
+    {
+        "ranking": "Score 1-10 based on fit with the ideal customer profile",
+        "reasoning": "One or two sentences explaining the score"
+    }
+
+    Only return the JSON object, no other text.
+    """,
+            output_key="qualification"
+        )
+        return SequentialAgent(
+            name="InfoProcessing",
+            sub_agents=[
+                QualificationGate(
+                    name="QualificationGate",
+                    qualification=SequentialAgent(name="Qualification", sub_agents=[client_target_agent, qualification_agent]),
+                    deep_research=SequentialAgent(
+                        name="DeepResearch",
+                        sub_agents=[
+                            ParallelAgent(name="ParallelResearch", sub_agents=[ceo_researcher, revenue_researcher, company_stats_researcher]),
+                            ranking_agent
+                        ]
+                    )
+                )
+            ]
+        )
+
+    researchers = [
+        ceo_researcher,
+        revenue_researcher,
+        company_stats_researcher,
+        client_target_agent
+    ]
+    final_agents = [ranking_agent]
+
+    if agent_names is not None:
+        researchers = [agent for agent in researchers if agent.name in agent_names]
+        final_agents = [agent for agent in final_agents if agent.name in agent_names]
+
+    if mode == "parallel" and len(researchers) > 1:
+        return SequentialAgent(
+            name="InfoProcessing",
+            sub_agents=[
+                ParallelAgent(name="ParallelResearch", sub_agents=researchers),
+                *final_agents
+            ]
+        )
+
     return SequentialAgent(
         name="InfoProcessing",
-        sub_agents=[
-            ceo_researcher,
-            revenue_researcher,
-            company_stats_researcher,
-            client_target_agent,
-            ranking_agent
-        ]
+        sub_agents=[*researchers, *final_agents]
     )
 
 # Add a function to create an email sequence agent
@@ -292,6 +475,7 @@ def create_email_sequence_agent() -> SequentialAgent:
     email_content_agent = LlmAgent(
             name="EmailContentGenerator",
             model=GEMINI_MODEL_2,  # Using the more capable model for better content generation
+            before_model_callback=rate_limit_model_call,
             instruction="""
         You are an expert email content writer specializing in B2B communication. Your task is to analyze the company data and create highly personalized email content.
 
@@ -358,6 +542,7 @@ def create_follow_up_agent() -> SequentialAgent:
     follow_up_email_agent = LlmAgent(
         name="FollowUpAgent",
         model=GEMINI_MODEL_2,
+        before_model_callback=rate_limit_model_call,
         instruction="""
         You are a follow-up email specialist. Create a professional follow-up email for company: {company_name}.
         
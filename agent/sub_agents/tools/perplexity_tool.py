@@ -1,71 +1,87 @@
 import asyncio
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 import os
+import weakref
 from dotenv import load_dotenv
 import httpx
 import json
-import re
+from ...cache import normalize_domain
+from ...config import (
+    PERPLEXITY_MAX_CONNECTIONS, PERPLEXITY_MAX_KEEPALIVE_CONNECTIONS, PERPLEXITY_KEEPALIVE_EXPIRY,
+    PERPLEXITY_BATCH_SIZE, PERPLEXITY_BATCH_WINDOW_SECONDS
+)
+from ...ingest import normalize_company_name
+from ...json_extract import extract_json_object, extract_json_records
+from ...monitoring import UsageTracker, current_usage, record_usage, track_usage
+from ...rate_limiter import get_rate_limiter
 
 load_dotenv()
 
 PERPLEXITY_API_KEY = os.getenv("PERPLEXITY_API_KEY")
+PERPLEXITY_API_URL = os.getenv("PERPLEXITY_API_URL", "https://api.perplexity.ai/chat/completions")
+PERPLEXITY_MODEL = "sonar"
+
+# One pooled client per event loop: httpx clients cannot be shared across loops,
+# and each enrichment job and email task runs its own loop.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_perplexity_client() -> httpx.AsyncClient:
+    """Return the long-lived, connection-pooled Perplexity client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=PERPLEXITY_MAX_CONNECTIONS,
+                max_keepalive_connections=PERPLEXITY_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=PERPLEXITY_KEEPALIVE_EXPIRY
+            ),
+            http2=_http2_available()
+        )
+        _clients[loop] = client
+    return client
+
+
+async def close_perplexity_client() -> None:
+    """Close the pooled client of the running event loop; call when a job finishes."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+class PerplexityRateLimitError(Exception):
+    """Raised when Perplexity answers 429; the shared limiter is paused before retrying."""
+
+
+def _handle_rate_limit(response: httpx.Response, fallback_delay: float) -> None:
+    """Pause the shared Perplexity limiter for the Retry-After period and raise."""
+    try:
+        retry_after = float(response.headers.get("retry-after", fallback_delay))
+    except ValueError:
+        retry_after = fallback_delay
+    get_rate_limiter("perplexity", PERPLEXITY_MODEL).pause(retry_after)
+    raise PerplexityRateLimitError(f"Perplexity API rate limited, retrying after {retry_after}s")
+
+def _record_perplexity_usage(payload: Dict[str, Any], tool_name: str) -> None:
+    """Attribute the token usage Perplexity reports for a response to the current row."""
+    usage = payload.get("usage") or {}
+    record_usage(
+        tool_name,
+        payload.get("model") or PERPLEXITY_MODEL,
+        input_tokens=usage.get("prompt_tokens", 0),
+        output_tokens=usage.get("completion_tokens", 0)
+    )
 
-def extract_json_object(text: str) -> str:
-    """
-    Extract the first valid JSON object from a text string.
-    Handles cases where JSON is embedded in text or has extra data.
-    """
-    # First try to find JSON in code blocks
-    if "```json" in text:
-        json_str = text.split("```json")[1].split("```")[0]
-    elif "```" in text:
-        json_str = text.split("```")[1].split("```")[0]
-    else:
-        json_str = text
-    
-    json_str = json_str.strip()
-    
-    # Try to find a JSON object using regex
-    json_pattern = r'\{[^{}]*\}'
-    # This pattern finds nested JSON objects
-    nested_pattern = r'\{(?:[^{}]|(?:\{[^{}]*\}))*\}'
-    
-    # First try simple pattern
-    match = re.search(json_pattern, json_str)
-    if match:
-        try:
-            json.loads(match.group())
-            json_str = match.group()
-        except:
-            # If simple pattern fails, try nested pattern
-            match = re.search(nested_pattern, json_str)
-            if match:
-                json_str = match.group()
-    
-    # If regex doesn't work, try brace counting
-    if json_str.startswith('{'):
-        brace_count = 0
-        in_string = False
-        escape = False
-        for i, char in enumerate(json_str):
-            if escape:
-                escape = False
-                continue
-            if char == '\\':
-                escape = True
-                continue
-            if char == '"' and not escape:
-                in_string = not in_string
-            if not in_string:
-                if char == '{':
-                    brace_count += 1
-                elif char == '}':
-                    brace_count -= 1
-                    if brace_count == 0:
-                        json_str = json_str[:i+1]
-                        break
-    
-    return json_str
 
 async def perplexity_research_tool(company_name: str, website: str) -> Dict[str, Any]:
     """
@@ -86,7 +102,7 @@ async def perplexity_research_tool(company_name: str, website: str) -> Dict[str,
     Find:
     1. Leadership & Contact:
        - CEO name
-       - CEO email
+       - CEO email (the CEO's direct address, not a generic inbox such as info@ or contact@)
        - Company headquarters
 
     2. Business Metrics:
@@ -120,67 +136,71 @@ async def perplexity_research_tool(company_name: str, website: str) -> Dict[str,
     max_retries = 3
     retry_delay = 2
     
+    limiter = get_rate_limiter("perplexity", PERPLEXITY_MODEL)
+    
     for attempt in range(max_retries):
         try:
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                response = await client.post(
-                    "https://api.perplexity.ai/chat/completions",
-                    headers=headers,
-                    json={
-                        "model": "sonar",
-                        "messages": [
-                            {"role": "system", "content": "You are a corporate research assistant. Always return responses in valid JSON format."},
-                            {"role": "user", "content": query}
-                        ]
-                    }
-                )
+            await limiter.acquire(len(query) // 4)
+            client = get_perplexity_client()
+            response = await client.post(
+                PERPLEXITY_API_URL,
+                headers=headers,
+                timeout=timeout,
+                json={
+                    "model": PERPLEXITY_MODEL,
+                    "messages": [
+                        {"role": "system", "content": "You are a corporate research assistant. Always return responses in valid JSON format."},
+                        {"role": "user", "content": query}
+                    ]
+                }
+            )
+            
+            if response.status_code == 429:
+                _handle_rate_limit(response, retry_delay * (attempt + 1))
+            if response.status_code != 200:
+                raise Exception(f"Perplexity API error: {response.text}")
+
+            try:
+                result = response.json()
+                _record_perplexity_usage(result, "Perplexity Research Tool")
+                content = result['choices'][0]['message']['content']
+                
+                data = extract_json_object(content)
+                
+                # Ensure all required fields exist with default empty values
+                default_data = {
+                    "ceo_name": "",
+                    "ceo_email": "",
+                    "company_revenue": "",
+                    "company_employee_count": "",
+                    "company_founding_year": "",
+                    "target_industries": [],
+                    "target_company_size": [],
+                    "target_geography": [],
+                    "client_examples": [],
+                    "service_focus": []
+                }
+                
+                # Update default data with any found values
+                default_data.update(data)
+                
+                return default_data
+                
+            except (json.JSONDecodeError, RecursionError, KeyError, IndexError) as e:
+                print(f"Error parsing Perplexity response: {e}")
+                return {
+                    "ceo_name": "",
+                    "ceo_email": "",
+                    "company_revenue": "",
+                    "company_employee_count": "",
+                    "company_founding_year": "",
+                    "target_industries": [],
+                    "target_company_size": [],
+                    "target_geography": [],
+                    "client_examples": [],
+                    "service_focus": []
+                }
                 
-                if response.status_code != 200:
-                    raise Exception(f"Perplexity API error: {response.text}")
-
-                try:
-                    result = response.json()
-                    content = result['choices'][0]['message']['content']
-                    
-                    # Extract JSON from the response
-                    json_str = extract_json_object(content)
-                    
-                    data = json.loads(json_str)
-                    
-                    # Ensure all required fields exist with default empty values
-                    default_data = {
-                        "ceo_name": "",
-                        "ceo_email": "",
-                        "company_revenue": "",
-                        "company_employee_count": "",
-                        "company_founding_year": "",
-                        "target_industries": [],
-                        "target_company_size": [],
-                        "target_geography": [],
-                        "client_examples": [],
-                        "service_focus": []
-                    }
-                    
-                    # Update default data with any found values
-                    default_data.update(data)
-                    
-                    return default_data
-                    
-                except (json.JSONDecodeError, KeyError, IndexError) as e:
-                    print(f"Error parsing Perplexity response: {e}")
-                    return {
-                        "ceo_name": "",
-                        "ceo_email": "",
-                        "company_revenue": "",
-                        "company_employee_count": "",
-                        "company_founding_year": "",
-                        "target_industries": [],
-                        "target_company_size": [],
-                        "target_geography": [],
-                        "client_examples": [],
-                        "service_focus": []
-                    }
-                    
         except httpx.ReadTimeout:
             print(f"Timeout on attempt {attempt + 1} for {company_name}")
             if attempt < max_retries - 1:
@@ -201,6 +221,11 @@ async def perplexity_research_tool(company_name: str, website: str) -> Dict[str,
                     "client_examples": [],
                     "service_focus": []
                 }
+        except PerplexityRateLimitError as e:
+            print(f"{e} (attempt {attempt + 1} for {company_name})")
+            if attempt < max_retries - 1:
+                continue
+            raise
         except Exception as e:
             print(f"Error on attempt {attempt + 1} for {company_name}: {e}")
             if attempt < max_retries - 1:
@@ -211,7 +236,7 @@ async def perplexity_research_tool(company_name: str, website: str) -> Dict[str,
 
 FIELD_PROMPTS = {
     "ceo_name": "CEO name",
-    "ceo_email": "CEO email",
+    "ceo_email": "CEO email (the CEO's direct address, not a generic inbox such as info@ or contact@)",
     "company_revenue": "Annual revenue/revenue range",
     "company_employee_count": "Number of employees",
     "company_founding_year": "Year founded",
@@ -256,32 +281,36 @@ async def get_specific_info_tool(company_name: str, website: str, fields_to_find
     max_retries = 3
     retry_delay = 2
     
+    limiter = get_rate_limiter("perplexity", PERPLEXITY_MODEL)
+    
     for attempt in range(max_retries):
         try:
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                response = await client.post(
-                    "https://api.perplexity.ai/chat/completions",
-                    headers=headers,
-                    json={
-                        "model": "sonar",
-                        "messages": [
-                            {"role": "system", "content": "You are a corporate research assistant. Always return responses in valid JSON format."},
-                            {"role": "user", "content": query}
-                        ]
-                    }
-                )
+            await limiter.acquire(len(query) // 4)
+            client = get_perplexity_client()
+            response = await client.post(
+                PERPLEXITY_API_URL,
+                headers=headers,
+                timeout=timeout,
+                json={
+                    "model": PERPLEXITY_MODEL,
+                    "messages": [
+                        {"role": "system", "content": "You are a corporate research assistant. Always return responses in valid JSON format."},
+                        {"role": "user", "content": query}
+                    ]
+                }
+            )
 
+            if response.status_code == 429:
+                _handle_rate_limit(response, retry_delay * (attempt + 1))
             if response.status_code != 200:
                 raise Exception(f"Perplexity API error: {response.text}")
 
             try:
                 result = response.json()
+                _record_perplexity_usage(result, "Perplexity Specific Fields Tool")
                 content = result['choices'][0]['message']['content']
                 
-                # Extract JSON from the response
-                json_str = extract_json_object(content)
-                
-                data = json.loads(json_str)
+                data = extract_json_object(content)
                 
                 default_data = {key: "" for key in fields_to_find}
                 for key in default_data:
@@ -292,7 +321,7 @@ async def get_specific_info_tool(company_name: str, website: str, fields_to_find
                 
                 return default_data
                 
-            except (json.JSONDecodeError, KeyError, IndexError) as e:
+            except (json.JSONDecodeError, RecursionError, KeyError, IndexError) as e:
                 print(f"Error parsing Perplexity response for specific fields: {e}")
                 return {key: "" for key in fields_to_find}
                 
@@ -305,10 +334,222 @@ async def get_specific_info_tool(company_name: str, website: str, fields_to_find
                 print(f"All retries exhausted for specific info on {company_name}")
                 # Return empty data on timeout
                 return {key: "" for key in fields_to_find}
+        except PerplexityRateLimitError as e:
+            print(f"{e} (attempt {attempt + 1} for specific info on {company_name})")
+            if attempt < max_retries - 1:
+                continue
+            raise
         except Exception as e:
             print(f"Error on attempt {attempt + 1} for specific info on {company_name}: {e}")
             if attempt < max_retries - 1:
                 await asyncio.sleep(retry_delay * (attempt + 1))
                 continue
             else:
-                raise
\ No newline at end of file
+                raise
+
+def _empty_research_data() -> Dict[str, Any]:
+    return {
+        "ceo_name": "",
+        "ceo_email": "",
+        "company_revenue": "",
+        "company_employee_count": "",
+        "company_founding_year": "",
+        "target_industries": [],
+        "target_company_size": [],
+        "target_geography": [],
+        "client_examples": [],
+        "service_focus": []
+    }
+
+
+async def _research_one(company_name: str, website: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    if fields is None:
+        return await perplexity_research_tool(company_name, website)
+    return await get_specific_info_tool(company_name, website, fields)
+
+
+async def perplexity_batch_research_tool(
+    companies: List[Tuple[str, str]],
+    fields: Optional[List[Optional[List[str]]]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Research several companies with a single Perplexity request.
+
+    Returns one result per (company_name, website) pair, in input order.
+    `fields` optionally lists, per company, the only fields to look for (None
+    asks for every field); a company's result then holds just those keys.
+    Entries missing from the response or that fail to parse fall back to
+    individual perplexity_research_tool / get_specific_info_tool calls.
+    """
+    fields = fields or [None] * len(companies)
+    if len(companies) == 1:
+        return [await _research_one(*companies[0], fields[0])]
+    if not PERPLEXITY_API_KEY:
+        raise ValueError("PERPLEXITY_API_KEY environment variable not set")
+
+    headers = {
+        "Authorization": f"Bearer {PERPLEXITY_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+    company_lines = []
+    for i, ((name, website), wanted) in enumerate(zip(companies, fields)):
+        line = f"    {i + 1}. Company Name: {name} | Website: {website}"
+        if wanted is not None:
+            line += " | Find only: " + "; ".join(FIELD_PROMPTS[field] for field in wanted if field in FIELD_PROMPTS)
+        company_lines.append(line)
+    company_lines = "\n".join(company_lines)
+    query = f"""Research each of the following companies:
+{company_lines}
+
+    Unless a company lists the only fields to find, find the CEO name and direct email (not a generic inbox such as info@), annual revenue/revenue range, number of employees,
+    year founded, primary target industries, target company sizes, geographical focus, notable clients
+    and core services/products.
+
+    Format the response as a JSON array with one object per company, in the same order, using these keys
+    (leave out the keys of fields a company did not ask for):
+    [
+        {{
+            "company_name": "string",
+            "website": "string",
+            "ceo_name": "string",
+            "ceo_email": "string",
+            "company_revenue": "string",
+            "company_employee_count": "string",
+            "company_founding_year": "string",
+            "target_industries": ["string"],
+            "target_company_size": ["string"],
+            "target_geography": ["string"],
+            "client_examples": ["string"],
+            "service_focus": ["string"]
+        }}
+    ]"""
+
+    timeout = httpx.Timeout(60.0, connect=5.0)
+    max_retries = 3
+    retry_delay = 2
+    limiter = get_rate_limiter("perplexity", PERPLEXITY_MODEL)
+
+    items: list = []
+    for attempt in range(max_retries):
+        try:
+            await limiter.acquire(len(query) // 4)
+            response = await get_perplexity_client().post(
+                PERPLEXITY_API_URL,
+                headers=headers,
+                timeout=timeout,
+                json={
+                    "model": PERPLEXITY_MODEL,
+                    "messages": [
+                        {"role": "system", "content": "You are a corporate research assistant. Always return responses in valid JSON format."},
+                        {"role": "user", "content": query}
+                    ]
+                }
+            )
+            if response.status_code == 429:
+                _handle_rate_limit(response, retry_delay * (attempt + 1))
+            if response.status_code != 200:
+                raise Exception(f"Perplexity API error: {response.text}")
+
+            result = response.json()
+            _record_perplexity_usage(result, "Perplexity Research Tool")
+            content = result['choices'][0]['message']['content']
+            items = extract_json_records(content)
+            break
+        except (json.JSONDecodeError, RecursionError, KeyError, IndexError) as e:
+            print(f"Error parsing Perplexity batch response: {e}")
+            break
+        except PerplexityRateLimitError as e:
+            print(f"{e} (attempt {attempt + 1} for batch of {len(companies)})")
+        except Exception as e:
+            print(f"Error on attempt {attempt + 1} for batch of {len(companies)}: {e}")
+            if attempt < max_retries - 1:
+                await asyncio.sleep(retry_delay * (attempt + 1))
+
+    # Match returned entries back to the requested companies by domain or name
+    by_key: Dict[str, Dict[str, Any]] = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        for key in (normalize_domain(str(item.get("website") or "")), normalize_company_name(str(item.get("company_name") or ""))):
+            if key:
+                by_key.setdefault(key, item)
+
+    results: List[Optional[Dict[str, Any]]] = []
+    for (name, website), wanted in zip(companies, fields):
+        item = by_key.get(normalize_domain(website)) or by_key.get(normalize_company_name(name))
+        if item is None:
+            results.append(None)
+            continue
+        data = _empty_research_data()
+        data.update({k: v for k, v in item.items() if k not in ("company_name", "website")})
+        if wanted is not None:
+            data = {k: data.get(k, "") for k in wanted}
+        results.append(data)
+
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        fallbacks = await asyncio.gather(*(_research_one(*companies[i], fields[i]) for i in missing))
+        for i, data in zip(missing, fallbacks):
+            results[i] = data
+
+    return results
+
+
+class PerplexityResearchBatcher:
+    """Coalesce concurrent fallback requests into batched Perplexity calls.
+
+    Callers await `research()` for a single company, optionally limited to the
+    fields they still need; requests arriving within `max_wait` seconds of each
+    other are sent together, up to `max_batch_size` companies per request.
+    """
+
+    def __init__(self, max_batch_size: int = PERPLEXITY_BATCH_SIZE, max_wait: float = PERPLEXITY_BATCH_WINDOW_SECONDS) -> None:
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self._pending: List[Tuple[str, str, Optional[List[str]], asyncio.Future, Optional[UsageTracker]]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def research(self, company_name: str, website: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        if self.max_batch_size == 1:
+            return await _research_one(company_name, website, fields)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((company_name, website, fields, future, current_usage()))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run_batch(batch))
+
+    @staticmethod
+    async def _run_batch(batch: List[Tuple[str, str, Optional[List[str]], asyncio.Future, Optional[UsageTracker]]]) -> None:
+        # A batched request is shared by its rows, so each caller is charged an equal share
+        batch_usage = UsageTracker()
+        try:
+            with track_usage(batch_usage):
+                results = await perplexity_batch_research_tool(
+                    [(name, website) for name, website, _, _, _ in batch],
+                    [fields for _, _, fields, _, _ in batch]
+                )
+        except Exception as e:
+            for _, _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            for _, _, _, _, tracker in batch:
+                if tracker is not None:
+                    tracker.merge(batch_usage, share=1 / len(batch))
+        for (_, _, _, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
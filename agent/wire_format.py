@@ -0,0 +1,91 @@
+import json
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import WIRE_COMPRESS_MIN_BYTES
+from .log_store import HEAVY_LOG_FIELDS
+
+# Wire formats a browser can ask for when it connects
+WIRE_JSON = "json"
+WIRE_COMPACT = "compact"
+WIRE_FORMATS = (WIRE_JSON, WIRE_COMPACT)
+
+# Events whose payload is {agent: [log records]} and is sent as columns in the compact format
+LOG_EVENTS = ("logs_append",)
+
+
+def to_columnar(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """{"columns": [...], "rows": [[...], ...]}: each key once instead of once per record."""
+    columns: List[str] = []
+    seen = set()
+    for record in records:
+        for key in record:
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+    return {"columns": columns, "rows": [[record.get(col) for col in columns] for record in records]}
+
+
+def compact_logs(grouped_logs: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """Grouped log records as columns, without the raw model output the live panel never shows."""
+    return {
+        agent: to_columnar([{k: v for k, v in log.items() if k not in HEAVY_LOG_FIELDS} for log in logs])
+        for agent, logs in grouped_logs.items()
+    }
+
+
+def encode(event: str, payload: Any, wire_format: str) -> Tuple[Any, Optional[int]]:
+    """Return what to emit for `event` in `wire_format`, and its size in bytes.
+
+    The JSON format sends the payload unchanged and its size is not measured
+    (None): that would serialize every payload a second time just for stats.
+    The compact format sends log events as columns and zlib-compresses any
+    payload whose JSON reaches WIRE_COMPRESS_MIN_BYTES; compressed payloads go
+    out as binary attachments.
+    """
+    if wire_format != WIRE_COMPACT:
+        return payload, None
+
+    if event in LOG_EVENTS:
+        payload = compact_logs(payload)
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    if len(body) < WIRE_COMPRESS_MIN_BYTES:
+        return payload, len(body)
+    compressed = zlib.compress(body, 6)
+    return compressed, len(compressed)
+
+
+class WireStats:
+    """Bytes and messages sent per session, wire format and event.
+
+    Bytes are None for messages whose size was not measured (the JSON format).
+    """
+
+    def __init__(self) -> None:
+        self._stats: Dict[str, Dict[str, Dict[str, Dict[str, Optional[int]]]]] = {}
+
+    def record(self, session_id: str, wire_format: str, event: str, size: Optional[int], recipients: int = 1) -> None:
+        totals = self._stats.setdefault(session_id, {}).setdefault(wire_format, {}).setdefault(event, {"messages": 0, "bytes": 0})
+        totals["messages"] += recipients
+        if size is None or totals["bytes"] is None:
+            totals["bytes"] = None
+        else:
+            totals["bytes"] += size * recipients
+
+    def session(self, session_id: str) -> Dict[str, Any]:
+        formats = self._stats.get(session_id, {})
+        result = {}
+        for wire_format, events in formats.items():
+            sizes = [totals["bytes"] for totals in events.values()]
+            result[wire_format] = {
+                "messages": sum(totals["messages"] for totals in events.values()),
+                "bytes": None if None in sizes else sum(sizes),
+                "by_event": events
+            }
+        return result
+
+    def clear(self, session_id: str) -> None:
+        self._stats.pop(session_id, None)
+
+
+wire_stats = WireStats()
@@ -6,13 +6,27 @@ from flask import Flask, request, jsonify, render_template, send_file, session
 from flask_socketio import SocketIO, join_room
 from flask_session import Session
 from agent.main import run_agent_async
+from agent.checkpoint import read_checkpoint
+from agent.ingest import missing_input_columns, read_input_header
+from agent.config import (
+    COMPANIES_MAX_PAGE_SIZE, COMPANIES_PAGE_SIZE, EVENT_BUS_FLUSH_INTERVAL_SECONDS, EVENT_BUS_MAX_BATCH,
+    LOGS_MAX_PAGE_SIZE, LOGS_PAGE_SIZE
+)
+from agent.events import EVENT_LOG, EVENT_ROWS, EVENT_TOTAL, event_bus
+from agent.log_store import add_token_usage, clear_logs, open_log_store
+from agent.live_updates import group_logs, read_session_snapshot
+from agent.results import clear_results, export_results_csv, open_result_store, results_db_path
+from agent.rate_limiter import rate_limiter_stats
+from agent.wire_format import WIRE_FORMATS, WIRE_JSON, encode, wire_stats
 from dotenv import load_dotenv
 from flask_sqlalchemy import SQLAlchemy
-import pandas as pd
 import os
 import json
+import sqlite3
 from datetime import timedelta, datetime
+import time
 import uuid
+from typing import Any, Dict, List, Optional, Tuple
 from eventlet.patcher import original
 real_threading = original('threading')
 load_dotenv()
@@ -62,91 +76,234 @@ app.config['BASE_DIR'] = BASE_DIR
 def index():
     if not session.get('session_id'):
         session['session_id'] = str(uuid.uuid4())
-        session['total_rows'] = 0  # Initialize total_rows
     return render_template('index.html')
 
-def stream_and_collect_data(session_id: str, total_rows: int = 0):
-    """Streams logs and collects enriched companies data."""
+# Running totals of sessions whose jobs publish to the event bus: token usage, processed rows, and
+# input rows read so far ('counting' until the job has read the whole input)
+_live_sessions: Dict[str, Dict[str, Any]] = {}
+_dispatcher_started = False
+# Connected clients: sid -> (session_id, wire format they asked for)
+_wire_clients: Dict[str, Tuple[str, str]] = {}
+# Connected clients: sid -> time.monotonic() of the last full snapshot they were sent
+_client_synced_at: Dict[str, float] = {}
+
+
+def wire_room(session_id: str, wire_format: str) -> str:
+    """Room of a session's clients that use `wire_format`; every client is also in the session room."""
+    return f"{session_id}:{wire_format}"
+
+
+def emit_to_session(event: str, payload: Any, session_id: str, sid: Optional[str] = None) -> None:
+    """Emit to every client of a session (or just `sid`), encoded once per wire format in use."""
+    if sid is not None:
+        audience = {_wire_clients.get(sid, (session_id, WIRE_JSON))[1]: 1}
+    else:
+        audience = {}
+        for client_session, wire_format in list(_wire_clients.values()):
+            if client_session == session_id:
+                audience[wire_format] = audience.get(wire_format, 0) + 1
+
+    for wire_format, recipients in audience.items():
+        data, size = encode(event, payload, wire_format)
+        socketio.emit(event, data, room=sid or wire_room(session_id, wire_format))
+        wire_stats.record(session_id, wire_format, event, size, recipients)
+
+
+def session_input_total(session_id: str) -> Tuple[int, bool]:
+    """Input rows of the session's job and whether it is still counting them.
+
+    A running job reports the rows it has read so far; a finished one recorded
+    the total in its checkpoint.
+    """
+    live = _live_sessions.get(session_id)
+    if live is not None:
+        return live['total'], live['counting']
+    checkpoint = read_checkpoint(os.path.join(BASE_DIR, 'files', session_id)) or {}
+    return checkpoint.get('total_rows') or 0, False
+
+
+def progress_payload(processed: int, total: int, counting: bool) -> Dict[str, Any]:
+    return {'processed': processed, 'total': total, 'counting': counting}
+
+
+def emit_session_snapshot(snapshot: Dict[str, Any], session_id: str, sid: Optional[str] = None) -> None:
+    """Send a full snapshot; clients replace the logs and companies they hold.
+
+    Logs are not part of it: clients reload them from /get-logs up to the
+    snapshot's log cursor, and live events append everything after that.
+    """
+    synced_at = time.monotonic()
+    for client_sid, (client_session, _) in list(_wire_clients.items()):
+        if client_sid == sid or (sid is None and client_session == session_id):
+            _client_synced_at[client_sid] = synced_at
+    emit_to_session('logs_reset', {'cursor': snapshot['log_cursor']}, session_id, sid)
+    emit_to_session('token_update', snapshot['token_usage'], session_id, sid)
+    emit_to_session('companies_changed', {'added': snapshot['processed'], 'reset': True}, session_id, sid)
+    emit_to_session('progress_update', progress_payload(snapshot['processed'], *session_input_total(session_id)), session_id, sid)
+
+
+def stream_and_collect_data(session_id: str, sid: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Sends the session's snapshot from disk, to its clients or just `sid`."""
     if not session_id:
-        return
+        return None
 
     with app.app_context():
-        # Create session directory if it doesn't exist
-        session_dir = os.path.join(BASE_DIR, 'files', session_id)
-        os.makedirs(session_dir, exist_ok=True)
+        try:
+            snapshot = read_session_snapshot(os.path.join(BASE_DIR, 'files', session_id))
+        except Exception as e:
+            print(f"Could not read data for session {session_id}. Error: {e}")
+            return None
+        emit_session_snapshot(snapshot, session_id, sid)
+        return snapshot
+
+
+def open_live_session(session_id: str, total_rows: Optional[int] = None) -> None:
+    """Start forwarding a job's published events to its room, seeded with what is already on disk.
+
+    `total_rows` is the input's row count when an earlier run already read the
+    whole file; otherwise the job reports it while reading.
+    """
+    snapshot = read_session_snapshot(os.path.join(BASE_DIR, 'files', session_id))
+    _live_sessions[session_id] = {
+        'token_usage': snapshot['token_usage'],
+        'processed': snapshot['processed'],
+        'total': total_rows or 0,
+        'counting': total_rows is None
+    }
+    event_bus.open(session_id)
+
+    global _dispatcher_started
+    if not _dispatcher_started:
+        _dispatcher_started = True
+        socketio.start_background_task(dispatch_events)
+
+
+def resync_lagging_clients(session_id: str, live: Dict[str, Any], last_drop_at: float) -> None:
+    """Resync, from the session's files, only the clients whose last snapshot predates dropped events."""
+    snapshot = read_session_snapshot(os.path.join(BASE_DIR, 'files', session_id))
+    live['token_usage'], live['processed'] = snapshot['token_usage'], snapshot['processed']
+    for sid, (client_session, _) in list(_wire_clients.items()):
+        if client_session == session_id and _client_synced_at.get(sid, 0.0) <= last_drop_at:
+            emit_session_snapshot(snapshot, session_id, sid)
+
+
+def emit_event_batch(session_id: str, live: Dict[str, Any], batch: List[Tuple[str, Any]]) -> None:
+    logs = [payload for kind, payload in batch if kind == EVENT_LOG]
+    rows = [row for kind, payload in batch if kind == EVENT_ROWS for row in payload]
+    totals = [payload for kind, payload in batch if kind == EVENT_TOTAL]
+
+    if logs:
+        for log in logs:
+            add_token_usage(live['token_usage'], log)
+        emit_to_session('logs_append', group_logs(logs), session_id)
+        emit_to_session('token_update', live['token_usage'], session_id)
+
+    for total in totals:
+        # A resumed job counts the input again; its running count never replaces a known total
+        if total['final'] or live['counting']:
+            live['total'], live['counting'] = total['total'], not total['final']
+
+    if rows:
+        # Clients re-fetch the page they show instead of receiving every row
+        live['processed'] += len(rows)
+        emit_to_session('companies_changed', {'added': len(rows), 'reset': False}, session_id)
+    if rows or totals:
+        emit_to_session('progress_update', progress_payload(live['processed'], live['total'], live['counting']), session_id)
+
+
+def dispatch_events():
+    """Forward events published by running jobs to their session rooms.
+
+    Runs as a single background task. Every flush interval it drains up to
+    EVENT_BUS_MAX_BATCH events per session and sends them as one batch per event
+    type. Once a session whose channel overflowed has been caught up, the
+    clients that missed the dropped events are resynced from its files.
+    """
+    while True:
+        for session_id, channel in event_bus.channels():
+            live = _live_sessions.get(session_id)
+            if live is None:
+                event_bus.remove(session_id)
+                continue
 
-        # Stream logs
-        logs_path = os.path.join(session_dir, 'logs.json')
-        if os.path.exists(logs_path):
             try:
-                with open(logs_path, 'r') as f:
-                    logs = [json.loads(line) for line in f if line.strip()]
-                
-                grouped_logs = {}
-                for log in logs:
-                    agent = log.get('agent', 'general')
-                    if agent not in grouped_logs:
-                        grouped_logs[agent] = []
-                    grouped_logs[agent].append(log)
-                socketio.emit('logs_update', grouped_logs, room=session_id)
-
-                # Collect token usage data
-                token_usage = {
-                    'total_input_tokens': 0,
-                    'total_output_tokens': 0,
-                    'total_cost': 0.0
-                }
-                for log in logs:
-                    token_usage['total_input_tokens'] += log.get('input_tokens', 0)
-                    token_usage['total_output_tokens'] += log.get('output_tokens', 0)
-                    token_usage['total_cost'] += log.get('cost', 0.0)
-                
-                socketio.emit('token_update', token_usage, room=session_id)
+                batch = channel.drain(EVENT_BUS_MAX_BATCH)
+                if batch:
+                    emit_event_batch(session_id, live, batch)
+                elif channel.overflowed:
+                    channel.overflowed = False
+                    resync_lagging_clients(session_id, live, channel.last_drop_at)
+                elif channel.closed:
+                    event_bus.remove(session_id)
+                    _live_sessions.pop(session_id, None)
             except Exception as e:
-                print(f"Error reading logs file: {e}")
+                print(f"Error dispatching events for session {session_id}: {e}")
 
-        # Collect enriched companies data and emit progress
-        companies_path = os.path.join(session_dir, 'companies.csv')
-        processed_rows = 0
-        if os.path.exists(companies_path):
-            try:
-                df = pd.read_csv(companies_path, engine='python', on_bad_lines='warn')
-                df = df.fillna('')
-                processed_rows = len(df)
-                socketio.emit('companies_update', df.to_dict(orient='records'), room=session_id)
-            except Exception as e:
-                print(f"Could not parse {companies_path}. It might be in the process of being written, empty, or contain errors. Error: {e}")
-        
-        current_total_rows = total_rows if total_rows > 0 else session.get('total_rows', 0)
-        socketio.emit('progress_update', {
-            'processed': processed_rows,
-            'total': current_total_rows
-        }, room=session_id)
+        socketio.sleep(EVENT_BUS_FLUSH_INTERVAL_SECONDS)
 
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
     print('Client connected')
     session_id = session.get('session_id')
     if session_id:
+        # Clients pick a wire format in the connection's auth payload; anything unknown gets plain JSON
+        wire_format = (auth or {}).get('wire') if isinstance(auth, dict) else None
+        if wire_format not in WIRE_FORMATS:
+            wire_format = WIRE_JSON
+        _wire_clients[request.sid] = (session_id, wire_format)
         join_room(session_id)
-        print(f"Client with sid {request.sid} joined room {session_id}")
-        # Initial data push on connect, can be empty if no process has run for this session
-        with app.app_context():
-            stream_and_collect_data(session_id, session.get('total_rows', 0))
+        join_room(wire_room(session_id, wire_format))
+        print(f"Client with sid {request.sid} joined room {session_id} ({wire_format})")
+        # Initial data push on connect, can be empty if no process has run for this session;
+        # live events for the room take over from here
+        stream_and_collect_data(session_id, sid=request.sid)
+
+@socketio.on('disconnect')
+def handle_disconnect(*args):
+    _wire_clients.pop(request.sid, None)
+    _client_synced_at.pop(request.sid, None)
+
+def _optional_float(name: str) -> Optional[float]:
+    value = request.args.get(name, '').strip()
+    return float(value) if value else None
+
 
 @app.route('/get-companies')
 def get_enriched_companies_data():
+    """One page of the session's enriched companies.
+
+    Query parameters: page, page_size, sort (a column name), order (asc/desc),
+    min_ranking, max_ranking and q (text search over name, website and CEO).
+    """
+    empty = {"companies": [], "total": 0, "page": 1, "page_size": COMPANIES_PAGE_SIZE}
     session_id = session.get('session_id')
     if not session_id:
-        return jsonify([])
-        
+        return jsonify(empty)
+
     try:
-        file_path = os.path.join(BASE_DIR, 'files', session_id, 'companies.csv')
-        df = pd.read_csv(file_path, engine='python', on_bad_lines='warn')
-        df = df.fillna('')
-        return jsonify(df.to_dict(orient='records'))
-    except (FileNotFoundError, pd.errors.ParserError, pd.errors.EmptyDataError):
-        return jsonify([])
+        page = max(1, int(request.args.get('page', 1)))
+        page_size = min(COMPANIES_MAX_PAGE_SIZE, max(1, int(request.args.get('page_size', COMPANIES_PAGE_SIZE))))
+        min_ranking = _optional_float('min_ranking')
+        max_ranking = _optional_float('max_ranking')
+    except ValueError:
+        return jsonify({"error": "page, page_size, min_ranking and max_ranking must be numbers"}), 400
+    sort = request.args.get('sort') or None
+    descending = request.args.get('order', 'asc').lower() == 'desc'
+    search = request.args.get('q', '').strip() or None
+
+    store = open_result_store(os.path.join(BASE_DIR, 'files', session_id))
+    if store is None:
+        return jsonify(empty)
+    try:
+        companies, total = store.query(page, page_size, sort, descending, min_ranking, max_ranking, search)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except sqlite3.Error:
+        return jsonify(empty)
+    finally:
+        store.close()
+
+    return jsonify({"companies": companies, "total": total, "page": page, "page_size": page_size})
 
 @app.route('/generate-leads', methods=['POST'])
 def generate_leads():
@@ -174,36 +331,42 @@ def generate_leads():
             input_file.save(filepath)
             print(f"File saved to {filepath}")
 
+            # Only the header is checked here; the agent streams the rows once and
+            # reports how many it has read with its progress events
             try:
-                if filename.endswith('.csv'):
-                    df_input = pd.read_csv(filepath, engine='python', on_bad_lines='warn')
-                elif filename.endswith(('.xls', '.xlsx')):
-                    df_input = pd.read_excel(filepath)
-                else:
-                    df_input = None
-                
-                if df_input is not None:
-                    session['total_rows'] = len(df_input)
-                else:
-                    session['total_rows'] = 0
+                missing = missing_input_columns(read_input_header(filepath))
+            except ValueError as e:
+                os.remove(filepath)
+                return jsonify({"error": str(e)}), 400
             except Exception as e:
-                print(f"Could not read input file to get total rows: {e}")
-                session['total_rows'] = 0
+                print(f"Could not read input file header: {e}")
+                missing = []
+            if missing:
+                os.remove(filepath)
+                return jsonify({"error": f"Missing column(s): {', '.join(missing)}"}), 400
 
-            logs_path = os.path.join(session_dir, 'logs.json')
-            if os.path.exists(logs_path):
-                os.remove(logs_path)
+            clear_logs(session_dir)
 
-            companies_path = os.path.join(session_dir, 'companies.csv')
-            if os.path.exists(companies_path):
-                os.remove(companies_path)
+            clear_results(session_dir)
 
             running_flag_path = os.path.join(session_dir, 'running')
             if os.path.exists(running_flag_path):
                 os.remove(running_flag_path)
                 
+            # Refresh mode only re-researches fields that are missing or stale in the cache
+            refresh = str(request.form.get('refresh', '')).lower() in ('1', 'true', 'yes')
+
+            # Optional per-job ICP document; defaults to BIZZZUP.docx
+            icp_document = None
+            icp_file = request.files.get('icpFile')
+            if icp_file and icp_file.filename:
+                if not icp_file.filename.lower().endswith('.docx'):
+                    return jsonify({"error": "ICP document must be a .docx file"}), 400
+                icp_document = os.path.join(session_dir, f"icp_{os.path.basename(icp_file.filename)}")
+                icp_file.save(icp_document)
+
             socketio.start_background_task(
-                run_agent_with_updates, filepath, session_id, session.get('total_rows', 0)
+                run_agent_with_updates, filepath, session_id, None, False, refresh, icp_document
             )
             
             return jsonify({"message": "Agent process started successfully."}), 200
@@ -221,6 +384,22 @@ def status():
     is_running = os.path.exists(running_flag_path)
     return jsonify({'running': is_running})
 
+@app.route('/rate-limits')
+def rate_limits():
+    """Queue depth and wait statistics of the shared Gemini/Perplexity rate limiters."""
+    return jsonify(rate_limiter_stats())
+
+@app.route('/wire-stats')
+def wire_stats_view():
+    """Socket.IO messages and bytes sent to this session's clients, per wire format and event.
+
+    Bytes are only measured for the compact format; they are null for JSON clients.
+    """
+    session_id = session.get('session_id')
+    if not session_id:
+        return jsonify({})
+    return jsonify(wire_stats.session(session_id))
+
 @app.route('/stop-agent', methods=['POST'])
 def stop_agent():
     session_id = session.get('session_id')
@@ -233,6 +412,37 @@ def stop_agent():
     
     return jsonify({"message": "Agent stop signal sent."})
 
+@app.route('/resume-agent', methods=['POST'])
+def resume_agent():
+    session_id = session.get('session_id')
+    if not session_id:
+        return jsonify({"error": "No active session"}), 400
+
+    session_dir = os.path.join(BASE_DIR, 'files', session_id)
+    if os.path.exists(os.path.join(session_dir, 'running')):
+        return jsonify({"error": "Agent is already running"}), 409
+
+    checkpoint = read_checkpoint(session_dir)
+    if not checkpoint or checkpoint.get('status') == 'complete':
+        return jsonify({"error": "No interrupted run to resume"}), 404
+
+    filepath = checkpoint.get('input_file')
+    if not filepath or not os.path.exists(filepath):
+        return jsonify({"error": "Input file for the interrupted run is no longer available"}), 404
+
+    icp_document = checkpoint.get('icp_document')
+    if icp_document and not os.path.exists(icp_document):
+        icp_document = None
+
+    socketio.start_background_task(
+        run_agent_with_updates, filepath, session_id, checkpoint.get('total_rows'), True, False, icp_document
+    )
+
+    return jsonify({
+        "message": "Agent resumed.",
+        "completed_rows": checkpoint.get('completed_rows', 0)
+    }), 200
+
 @app.route('/clear-data', methods=['POST'])
 def clear_data():
     import shutil
@@ -248,7 +458,7 @@ def clear_data():
             
     return jsonify({"message": "Session data cleared."})
 
-def run_agent_with_updates(filepath: str, session_id: str, total_rows: int):
+def run_agent_with_updates(filepath: str, session_id: str, total_rows: Optional[int] = None, resume: bool = False, refresh: bool = False, icp_document: Optional[str] = None):
     """Run the agent and periodically send updates via WebSocket."""
     session_dir = os.path.join(BASE_DIR, 'files', session_id)
     running_flag_path = os.path.join(session_dir, 'running')
@@ -256,27 +466,28 @@ def run_agent_with_updates(filepath: str, session_id: str, total_rows: int):
 
     def agent_task():
         """Wrapper function to run the agent."""
-        run_agent_async(filepath, session_id)
+        run_agent_async(filepath, session_id, resume=resume, refresh=refresh, icp_document=icp_document)
 
     try:
         with open(running_flag_path, 'w') as f:
             f.write('running')
 
+        # Progress reaches the room through the event bus; the files are only the durable record
+        open_live_session(session_id, total_rows)
+
         agent_thread = real_threading.Thread(target=agent_task)
         agent_thread.start()
 
+        # The agent only checks the stop flag between rows, so wait for it to wind down;
+        # the session stays 'running' until then and cannot be resumed twice
+        stop_reported = False
         while agent_thread.is_alive():
-            if os.path.exists(stop_flag_path):
-                print(f"Stop signal detected for session {session_id}. Stopping agent.")
-                break 
+            if not stop_reported and os.path.exists(stop_flag_path):
+                print(f"Stop signal detected for session {session_id}. Waiting for the agent to finish its current rows.")
+                stop_reported = True
+            socketio.sleep(1)
 
-            with app.app_context():
-                stream_and_collect_data(session_id, total_rows)
-            socketio.sleep(2)
-
-        # One last poll to ensure we get the final data
-        with app.app_context():
-            stream_and_collect_data(session_id, total_rows)
+        event_bus.close(session_id)
             
     finally:
         if os.path.exists(running_flag_path):
@@ -285,32 +496,45 @@ def run_agent_with_updates(filepath: str, session_id: str, total_rows: int):
         if os.path.exists(stop_flag_path):
             os.remove(stop_flag_path)
         
-        if os.path.exists(filepath):
+        # Keep the input file around until the run completes so it can be resumed
+        checkpoint = read_checkpoint(session_dir) or {}
+        if checkpoint.get('status') == 'complete' and os.path.exists(filepath):
             os.remove(filepath)
             print(f"File {filepath} removed.")
 
 
 @app.route('/get-logs')
 def get_logs():
+    """One page of the session's log records, oldest first.
+
+    Query parameters: agent, task, level and company filters, cursor (the
+    next_cursor of the previous page), limit, and include_payload=1 to include
+    raw model output and other heavy fields.
+    """
+    empty = {"logs": [], "next_cursor": None}
     session_id = session.get('session_id')
     if not session_id:
-        return jsonify({})
-        
+        return jsonify(empty)
+
     try:
-        logs_path = os.path.join(BASE_DIR, 'files', session_id, 'logs.json')
-        with open(logs_path, 'r') as f:
-            logs = [json.loads(line) for line in f if line.strip()]
-        
-        grouped_logs = {}
-        for log in logs:
-            agent = log.get('agent', 'general')
-            if agent not in grouped_logs:
-                grouped_logs[agent] = []
-            grouped_logs[agent].append(log)
-            
-        return jsonify(grouped_logs)
-    except FileNotFoundError:
-        return jsonify({})
+        cursor = int(request.args['cursor']) if request.args.get('cursor') else None
+        limit = min(LOGS_MAX_PAGE_SIZE, max(1, int(request.args.get('limit', LOGS_PAGE_SIZE))))
+    except ValueError:
+        return jsonify({"error": "cursor and limit must be integers"}), 400
+    include_payload = str(request.args.get('include_payload', '')).lower() in ('1', 'true', 'yes')
+    filters = {field: request.args.get(field) or None for field in ('agent', 'task', 'level', 'company')}
+
+    store = open_log_store(os.path.join(BASE_DIR, 'files', session_id))
+    if store is None:
+        return jsonify(empty)
+    try:
+        logs, next_cursor = store.query(cursor=cursor, limit=limit, include_payload=include_payload, **filters)
+    except sqlite3.Error:
+        return jsonify(empty)
+    finally:
+        store.close()
+
+    return jsonify({"logs": logs, "next_cursor": next_cursor})
 
 @app.route('/download_file')
 def download_file():
@@ -318,19 +542,18 @@ def download_file():
     if not session_id:
         return jsonify({"error": "No active session found"}), 400
 
-    file_path = os.path.join(BASE_DIR, 'files', session_id, 'companies.csv')
-    logs_path = os.path.join(BASE_DIR, 'files', session_id, 'logs.json')
+    session_dir = os.path.join(BASE_DIR, 'files', session_id)
 
     # Check if processing is still ongoing
     agent_running_path = os.path.join(BASE_DIR, 'files', session_id, 'running')
     if os.path.exists(agent_running_path):
         return jsonify({"error": "File is still being generated, please try again in a few seconds"}), 202
 
-    # Check if file exists
-    if not os.path.exists(file_path):
-        return jsonify({"error": "No data file found. Please upload and process a file first."}), 404
-
     try:
+        # companies.csv is generated from the result store on demand
+        file_path = export_results_csv(session_dir)
+        if file_path is None:
+            return jsonify({"error": "No data file found. Please upload and process a file first."}), 404
         return send_file(
             file_path,
             as_attachment=True,
@@ -373,8 +596,8 @@ def send_bulk_emails():
         if rank_min is not None and rank_max is not None and rank_min > rank_max:
             return jsonify({"error": "Minimum rank cannot be greater than maximum rank"}), 400
     
-    companies_path = os.path.join(BASE_DIR, 'files', session_id, 'companies.csv')
-    if not os.path.exists(companies_path):
+    results_path = results_db_path(os.path.join(BASE_DIR, 'files', session_id))
+    if not os.path.exists(results_path):
         return jsonify({"error": "No companies data found"}), 404
 
     # For follow-up mode, check if summary file exists
@@ -390,7 +613,7 @@ def send_bulk_emails():
             asyncio.set_event_loop(loop)
             
             # Run the email task
-            loop.run_until_complete(send_emails_task(session_id, companies_path, mode, socketio, app, rank_min=rank_min, rank_max=rank_max, selected_emails=selected_emails))
+            loop.run_until_complete(send_emails_task(session_id, results_path, mode, socketio, app, rank_min=rank_min, rank_max=rank_max, selected_emails=selected_emails))
 
             # Give the loop a moment to process any pending callbacks from client cleanup
             try:
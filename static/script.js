@@ -1,11 +1,46 @@
 document.addEventListener('DOMContentLoaded', function() {
-    // Socket connection setup
+    // Socket connection setup. Browsers that can inflate deflate streams ask for the
+    // compact wire format: logs as columns, large payloads zlib-compressed
+    const wireFormat = typeof DecompressionStream === 'function' ? 'compact' : 'json';
     const socket = io({
         auth: {
-            session_id: sessionId
+            session_id: sessionId,
+            wire: wireFormat
         }
     });
 
+    // Compressed payloads are decoded asynchronously; chaining keeps events in arrival order
+    let wireQueue = Promise.resolve();
+
+    function onWire(event, handler) {
+        socket.on(event, function(data) {
+            wireQueue = wireQueue
+                .then(() => decodePayload(data))
+                .then(handler)
+                .catch(error => console.error(`Could not handle ${event}:`, error));
+        });
+    }
+
+    async function decodePayload(data) {
+        if (!(data instanceof ArrayBuffer || ArrayBuffer.isView(data))) return data;
+        const stream = new Blob([data]).stream().pipeThrough(new DecompressionStream('deflate'));
+        return JSON.parse(await new Response(stream).text());
+    }
+
+    // {agent: {columns, rows}} back to {agent: [log, ...]}; plain JSON payloads pass through
+    function fromColumnarLogs(data) {
+        const logs = {};
+        for (const agent in data) {
+            const group = data[agent];
+            logs[agent] = Array.isArray(group) ? group : group.rows.map(row => {
+                const log = {};
+                group.columns.forEach((column, i) => { log[column] = row[i]; });
+                return log;
+            });
+        }
+        return logs;
+    }
+
     const agentMonitoringContainer = document.getElementById('agent-monitoring-container');
     const companiesBody = document.getElementById('enriched-companies-body');
     const dataModalElement = document.getElementById('dataModal');
@@ -24,7 +59,16 @@ document.addEventListener('DOMContentLoaded', function() {
     // Initialize email modal
     const emailModal = new bootstrap.Modal(document.getElementById('emailModal'));
     let emailStatusList = null;
-    let companiesData = []; // Store companies data for sorting
+    let companiesData = []; // Companies on the page currently shown
+    // Page, sort and filters sent to /get-companies; the server returns only that page
+    let companiesQuery = { page: 1, page_size: 50, sort: '', order: '', q: '', min_ranking: '', max_ranking: '' };
+    let companiesTotal = 0;
+    let companiesRefreshTimer = null;
+    let agentLogBodies = {}; // agent name -> accordion body holding its log entries
+    // Log panel reload in flight, and the live log entries held back until it is done
+    let logsReload = null;
+    let heldLogAppends = [];
+    const LOGS_PAGE_LIMIT = 1000;
     let currentSortOrder = null; // Track current sort order
     let currentEmailSortOrder = null; // Track CEO email presence sort order
     let selectedEmails = new Set();
@@ -163,19 +207,28 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
-    socket.on('logs_update', function(data) {
-        updateLogs(data);
+    // Snapshot on connect or resync: reload the log panel from /get-logs up to the given log id
+    onWire('logs_reset', function(data) {
+        reloadLogs(data.cursor);
     });
 
-    socket.on('companies_update', function(data) {
-        updateCompanies(data);
+    // Only the log entries written since the previous update
+    onWire('logs_append', function(data) {
+        const logs = fromColumnarLogs(data);
+        if (logsReload) heldLogAppends.push(logs);
+        else appendLogs(logs);
     });
 
-    socket.on('token_update', function(data) {
+    // New companies were stored; re-fetch the page being shown
+    onWire('companies_changed', function(data) {
+        scheduleCompaniesRefresh();
+    });
+
+    onWire('token_update', function(data) {
         updateTokens(data);
     });
 
-    socket.on('progress_update', function(data) {
+    onWire('progress_update', function(data) {
         updateProgress(data);
     });
 
@@ -200,9 +253,11 @@ document.addEventListener('DOMContentLoaded', function() {
                     progressBar.style.width = percentage + '%';
                     progressBar.setAttribute('aria-valuenow', percentage);
                 }
-                if (progressText) progressText.textContent = `${data.processed} / ${data.total} companies processed`;
+                // While the job is still reading the input, the total is the row count so far
+                const total = data.counting ? `${data.total}+` : data.total;
+                if (progressText) progressText.textContent = `${data.processed} / ${total} companies processed`;
 
-                if (data.processed === data.total) {
+                if (!data.counting && data.processed === data.total) {
                     if (progressBar) {
                         progressBar.classList.remove('progress-bar-animated');
                         progressBar.classList.add('bg-success');
@@ -227,114 +282,229 @@ document.addEventListener('DOMContentLoaded', function() {
     function updateLogs(data) {
         if (!agentMonitoringContainer) return;
         agentMonitoringContainer.innerHTML = '';
-        agentMonitoringContainer.className = 'accordion';
-        agentMonitoringContainer.id = 'agentLogsAccordion';
+        agentLogBodies = {};
+        appendLogs(data);
+    }
 
-        let isFirst = true;
-        let i = 0;
+    // Pages the session's logs (without raw model output) from /get-logs, oldest first
+    function reloadLogs(untilId) {
+        const reload = {};
+        logsReload = reload;
+        heldLogAppends = [];
+        updateLogs({});
+        loadLogPages(untilId, null, reload)
+            .catch(error => console.error('Could not load logs:', error))
+            .finally(() => {
+                if (logsReload !== reload) return;
+                logsReload = null;
+                heldLogAppends.forEach(appendLogs);
+                heldLogAppends = [];
+            });
+    }
+
+    function loadLogPages(untilId, cursor, reload) {
+        if (!untilId) return Promise.resolve();
+        const params = new URLSearchParams({ limit: LOGS_PAGE_LIMIT });
+        if (cursor) params.set('cursor', cursor);
+        return fetch(`/get-logs?${params.toString()}`)
+            .then(response => response.json())
+            .then(data => {
+                // A newer reload or a reset of the panel replaced this one
+                if (logsReload !== reload) return;
+                const page = (data.logs || []).filter(log => log.id <= untilId);
+                const grouped = {};
+                page.forEach(log => {
+                    const agent = log.agent || 'general';
+                    (grouped[agent] = grouped[agent] || []).push(log);
+                });
+                appendLogs(grouped);
+                const lastId = page.length ? page[page.length - 1].id : untilId;
+                if (data.next_cursor && lastId < untilId) return loadLogPages(untilId, data.next_cursor, reload);
+            });
+    }
+
+    function appendLogs(data) {
+        if (!agentMonitoringContainer) return;
         for (const agent in data) {
-            const accordionItemId = `collapse${i}`;
-            const headerId = `heading${i}`;
+            const body = agentLogBodies[agent] || createAgentLogSection(agent);
+            data[agent].forEach(log => body.appendChild(createLogElement(log)));
+        }
+    }
 
-            const agentContainer = document.createElement('div');
-            agentContainer.className = 'accordion-item';
+    function createAgentLogSection(agent) {
+        const i = Object.keys(agentLogBodies).length;
+        const isFirst = i === 0;
+        if (isFirst) {
+            agentMonitoringContainer.className = 'accordion';
+            agentMonitoringContainer.id = 'agentLogsAccordion';
+        }
+        const accordionItemId = `collapse${i}`;
+        const headerId = `heading${i}`;
 
-            const header = document.createElement('h2');
-            header.className = 'accordion-header';
-            header.id = headerId;
-            
-            const button = document.createElement('button');
-            button.className = 'accordion-button';
-            if (isFirst) {
-                button.setAttribute('aria-expanded', 'true');
-            } else {
-                button.classList.add('collapsed');
-                button.setAttribute('aria-expanded', 'false');
-            }
-            button.setAttribute('type', 'button');
-            button.setAttribute('data-bs-toggle', 'collapse');
-            button.setAttribute('data-bs-target', `#${accordionItemId}`);
-            button.setAttribute('aria-controls', accordionItemId);
-            button.innerHTML = `<i class="fas fa-robot me-2"></i>Agent: ${agent}`;
-            header.appendChild(button);
-
-            const collapseContainer = document.createElement('div');
-            collapseContainer.id = accordionItemId;
-            collapseContainer.className = 'accordion-collapse collapse';
-            if (isFirst) {
-                collapseContainer.classList.add('show');
-            }
-            collapseContainer.setAttribute('aria-labelledby', headerId);
-            collapseContainer.setAttribute('data-bs-parent', '#agentLogsAccordion');
+        const agentContainer = document.createElement('div');
+        agentContainer.className = 'accordion-item';
 
-            const body = document.createElement('div');
-            body.className = 'accordion-body agent-log-body';
-            
-            data[agent].forEach(log => {
-                const logElement = document.createElement('div');
-                const levelColor = log.level === 'INFO' ? '#3498db' : 
-                                 log.level === 'WARNING' ? '#f1c40f' : 
-                                 log.level === 'ERROR' ? '#e74c3c' : '#2ecc71';
-                logElement.innerHTML = `
-                    <div>
-                        <span style="color: #bdc3c7">[${log.timestamp}]</span> 
-                        <span style="color: ${levelColor}">[${log.level}]</span> 
-                    </div>
-                    <div style="padding-left: 20px;"><strong>Task:</strong> ${log.task}</div>
-                `;
-                body.appendChild(logElement);
-            });
+        const header = document.createElement('h2');
+        header.className = 'accordion-header';
+        header.id = headerId;
+        
+        const button = document.createElement('button');
+        button.className = 'accordion-button';
+        if (isFirst) {
+            button.setAttribute('aria-expanded', 'true');
+        } else {
+            button.classList.add('collapsed');
+            button.setAttribute('aria-expanded', 'false');
+        }
+        button.setAttribute('type', 'button');
+        button.setAttribute('data-bs-toggle', 'collapse');
+        button.setAttribute('data-bs-target', `#${accordionItemId}`);
+        button.setAttribute('aria-controls', accordionItemId);
+        button.innerHTML = `<i class="fas fa-robot me-2"></i>Agent: ${agent}`;
+        header.appendChild(button);
+
+        const collapseContainer = document.createElement('div');
+        collapseContainer.id = accordionItemId;
+        collapseContainer.className = 'accordion-collapse collapse';
+        if (isFirst) {
+            collapseContainer.classList.add('show');
+        }
+        collapseContainer.setAttribute('aria-labelledby', headerId);
+        collapseContainer.setAttribute('data-bs-parent', '#agentLogsAccordion');
 
-            collapseContainer.appendChild(body);
-            agentContainer.appendChild(header);
-            agentContainer.appendChild(collapseContainer);
-            agentMonitoringContainer.appendChild(agentContainer);
-            
-            isFirst = false;
-            i++;
+        const body = document.createElement('div');
+        body.className = 'accordion-body agent-log-body';
+
+        collapseContainer.appendChild(body);
+        agentContainer.appendChild(header);
+        agentContainer.appendChild(collapseContainer);
+        agentMonitoringContainer.appendChild(agentContainer);
+
+        agentLogBodies[agent] = body;
+        return body;
+    }
+
+    function createLogElement(log) {
+        const logElement = document.createElement('div');
+        const levelColor = log.level === 'INFO' ? '#3498db' : 
+                         log.level === 'WARNING' ? '#f1c40f' : 
+                         log.level === 'ERROR' ? '#e74c3c' : '#2ecc71';
+        logElement.innerHTML = `
+            <div>
+                <span style="color: #bdc3c7">[${log.timestamp}]</span> 
+                <span style="color: ${levelColor}">[${log.level}]</span> 
+            </div>
+            <div style="padding-left: 20px;"><strong>Task:</strong> ${log.task}</div>
+        `;
+        return logElement;
+    }
+
+    function loadCompanies() {
+        const params = new URLSearchParams();
+        for (const key in companiesQuery) {
+            if (companiesQuery[key] !== '' && companiesQuery[key] !== null) params.set(key, companiesQuery[key]);
         }
+        return fetch(`/get-companies?${params.toString()}`)
+            .then(response => response.json())
+            .then(data => {
+                if (data.error) {
+                    showError('Error', data.error);
+                    return;
+                }
+                companiesData = data.companies;
+                companiesTotal = data.total;
+                renderCompaniesTable(companiesData);
+                updateCompaniesPager();
+            })
+            .catch(error => console.error('Error loading companies:', error));
     }
 
-    function updateCompanies(data) {
-        if (!companiesBody) return;
-        companiesData = data; // Store data for sorting
-        renderCompaniesTable(data);
+    // Live updates can arrive many times a second; fetch the page at most once a second
+    function scheduleCompaniesRefresh() {
+        if (companiesRefreshTimer) return;
+        companiesRefreshTimer = setTimeout(() => {
+            companiesRefreshTimer = null;
+            loadCompanies();
+        }, 1000);
+    }
+
+    function updateCompaniesPager() {
+        const info = document.getElementById('companies-page-info');
+        const prev = document.getElementById('companies-prev');
+        const next = document.getElementById('companies-next');
+        const pageCount = Math.max(1, Math.ceil(companiesTotal / companiesQuery.page_size));
+        const first = companiesTotal ? (companiesQuery.page - 1) * companiesQuery.page_size + 1 : 0;
+        const last = Math.min(companiesTotal, companiesQuery.page * companiesQuery.page_size);
+        if (info) info.textContent = `Showing ${first}-${last} of ${companiesTotal} companies (page ${companiesQuery.page} of ${pageCount})`;
+        if (prev) prev.disabled = companiesQuery.page <= 1;
+        if (next) next.disabled = companiesQuery.page >= pageCount;
+    }
+
+    window.changeCompaniesPage = function(delta) {
+        companiesQuery.page = Math.max(1, companiesQuery.page + delta);
+        loadCompanies();
+    };
+
+    // Search text and ranking range; applied when a field changes (Enter or losing focus)
+    window.applyCompaniesFilters = function() {
+        const search = document.getElementById('companies-search');
+        const minRanking = document.getElementById('companies-min-ranking');
+        const maxRanking = document.getElementById('companies-max-ranking');
+        companiesQuery.q = search ? search.value.trim() : '';
+        companiesQuery.min_ranking = minRanking ? minRanking.value : '';
+        companiesQuery.max_ranking = maxRanking ? maxRanking.value : '';
+        companiesQuery.page = 1;
+        loadCompanies();
+    };
+
+    function resetCompaniesView() {
+        if (companiesBody) companiesBody.innerHTML = '';
+        companiesData = [];
+        companiesTotal = 0;
+        companiesQuery = { page: 1, page_size: companiesQuery.page_size, sort: '', order: '', q: '', min_ranking: '', max_ranking: '' };
+        ['companies-search', 'companies-min-ranking', 'companies-max-ranking'].forEach(id => {
+            const input = document.getElementById(id);
+            if (input) input.value = '';
+        });
+        updateCompaniesPager();
     }
 
     function renderCompaniesTable(data) {
         if (!companiesBody) return;
         companiesBody.innerHTML = '';
-        data.forEach(company => {
-            const emailVal = company['CEO Email'] || company['Email'] || '';
-            const safeEmailAttr = String(emailVal).replace(/\"/g, '&quot;');
-            const row = document.createElement('tr');
-            row.onclick = () => showCompanyDetails(row);
-            row.innerHTML = `
-                <td class="text-center">
-                    <input type="checkbox" class="form-check-input row-selector" data-email="${safeEmailAttr}" onclick="event.stopPropagation()" onchange="toggleSelectEmail(this.getAttribute('data-email'), this.checked)">
-                </td>
-                <td class="fw-bold text-truncate">${company['Company Name']}</td>
-                <td class="text-truncate"><a href="${company['Website']}" class="text-decoration-none" target="_blank">${company['Website']}</a></td>
-                <td class="text-truncate">${company['CEO Name']}</td>
-                <td class="text-truncate">${company['CEO Email']}</td>
-                <td class="text-truncate">${company['Company Revenue']}</td>
-                <td class="text-truncate">${company['Company Employee Count']}</td>
-                <td class="text-truncate">${company['Company Founding Year']}</td>
-                <td class="text-truncate">${company['Target Industries']}</td>
-                <td class="text-truncate">${company['Target Company Size']}</td>
-                <td class="text-truncate">${company['Target Geography']}</td>
-                <td class="text-truncate">${company['Client Examples']}</td>
-                <td class="text-truncate">${company['Service Focus']}</td>
-                <td class="text-truncate">${company['Ranking']}</td>
-                <td class="text-truncate">${company['Reasoning']}</td>
-                <td class="text-truncate">
-                    <button class="btn btn-sm btn-primary" type="button" onclick="event.stopPropagation(); viewEmailContent('${(company['CEO Email'] || '').replace(/'/g, "&#39;")}')">
-                        View
-                    </button>
-                </td>
-            `;
-            companiesBody.appendChild(row);
-        });
+        data.forEach(appendCompanyRow);
+    }
+
+    function appendCompanyRow(company) {
+        const emailVal = company['CEO Email'] || company['Email'] || '';
+        const safeEmailAttr = String(emailVal).replace(/\"/g, '&quot;');
+        const row = document.createElement('tr');
+        row.onclick = () => showCompanyDetails(row);
+        row.innerHTML = `
+            <td class="text-center">
+                <input type="checkbox" class="form-check-input row-selector" data-email="${safeEmailAttr}" onclick="event.stopPropagation()" onchange="toggleSelectEmail(this.getAttribute('data-email'), this.checked)">
+            </td>
+            <td class="fw-bold text-truncate">${company['Company Name']}</td>
+            <td class="text-truncate"><a href="${company['Website']}" class="text-decoration-none" target="_blank">${company['Website']}</a></td>
+            <td class="text-truncate">${company['CEO Name']}</td>
+            <td class="text-truncate">${company['CEO Email']}</td>
+            <td class="text-truncate">${company['Company Revenue']}</td>
+            <td class="text-truncate">${company['Company Employee Count']}</td>
+            <td class="text-truncate">${company['Company Founding Year']}</td>
+            <td class="text-truncate">${company['Target Industries']}</td>
+            <td class="text-truncate">${company['Target Company Size']}</td>
+            <td class="text-truncate">${company['Target Geography']}</td>
+            <td class="text-truncate">${company['Client Examples']}</td>
+            <td class="text-truncate">${company['Service Focus']}</td>
+            <td class="text-truncate">${company['Ranking']}</td>
+            <td class="text-truncate">${company['Reasoning']}</td>
+            <td class="text-truncate">
+                <button class="btn btn-sm btn-primary" type="button" onclick="event.stopPropagation(); viewEmailContent('${(company['CEO Email'] || '').replace(/'/g, "&#39;")}')">
+                    View
+                </button>
+            </td>
+        `;
+        companiesBody.appendChild(row);
     }
 
     // View Email Content
@@ -493,8 +663,10 @@ document.addEventListener('DOMContentLoaded', function() {
 
                 // Reset UI elements
         if (agentMonitoringContainer) agentMonitoringContainer.innerHTML = '';
-        if (companiesBody) companiesBody.innerHTML = '';
-        companiesData = []; // Clear stored data
+        agentLogBodies = {};
+        logsReload = null;
+        heldLogAppends = [];
+        resetCompaniesView();
         currentSortOrder = null; // Reset ranking sort order
         currentEmailSortOrder = null; // Reset email presence sort order
         const sortIcon = document.getElementById('ranking-sort-icon');
@@ -522,6 +694,10 @@ document.addEventListener('DOMContentLoaded', function() {
 
         const formData = new FormData();
         formData.append('inputFile', file);
+        const icpInput = document.getElementById('icpFileInput');
+        if (icpInput && icpInput.files.length > 0) {
+            formData.append('icpFile', icpInput.files[0]);
+        }
 
         fetch('/generate-leads', {
             method: 'POST',
@@ -627,8 +803,10 @@ document.addEventListener('DOMContentLoaded', function() {
                     } else {
                         showSuccess('Success', 'All data has been cleared');
             if (agentMonitoringContainer) agentMonitoringContainer.innerHTML = '';
-            if (companiesBody) companiesBody.innerHTML = '';
-            companiesData = []; // Clear stored data
+            agentLogBodies = {};
+            logsReload = null;
+            heldLogAppends = [];
+            resetCompaniesView();
             currentSortOrder = null; // Reset ranking sort order
             currentEmailSortOrder = null; // Reset email presence sort order
             const sortIcon = document.getElementById('ranking-sort-icon');
@@ -820,12 +998,12 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Toggle sorting function for ranking column
     window.toggleRankingSort = function() {
-        if (!companiesData || companiesData.length === 0) {
+        if (!companiesTotal) {
             showWarning('No Data', 'No companies data available to sort.');
             return;
         }
 
-        // Determine next sort order (toggle between asc, desc, and original)
+        // Determine next sort order (toggle between desc, asc, and original)
         let nextOrder;
         if (currentSortOrder === null) {
             nextOrder = 'desc'; // Start with High to Low
@@ -835,55 +1013,31 @@ document.addEventListener('DOMContentLoaded', function() {
             nextOrder = null; // Return to original order
         }
 
+        // The server sorts the whole session, so only one column can be the sort key
+        currentSortOrder = nextOrder;
+        currentEmailSortOrder = null;
+        const emailSortIcon = document.getElementById('email-sort-icon');
+        if (emailSortIcon) emailSortIcon.className = 'fas fa-sort ms-1';
+
         const sortIcon = document.getElementById('ranking-sort-icon');
-        
-        if (nextOrder === null) {
-            // Return to original order
-            renderCompaniesTable(companiesData);
-            currentSortOrder = null;
-            if (sortIcon) sortIcon.className = 'fas fa-sort ms-1';
-            showSuccess('Sorted', 'Returned to original order');
-            return;
+        if (sortIcon) {
+            sortIcon.className = nextOrder === 'asc' ? 'fas fa-sort-up ms-1' :
+                                 nextOrder === 'desc' ? 'fas fa-sort-down ms-1' : 'fas fa-sort ms-1';
         }
 
-        // Create a copy of the data for sorting
-        const sortedData = [...companiesData];
-        
-        // Sort function
-        sortedData.sort((a, b) => {
-            const rankingA = parseFloat(a['Ranking']) || 0;
-            const rankingB = parseFloat(b['Ranking']) || 0;
-            
-            if (nextOrder === 'asc') {
-                return rankingA - rankingB; // Low to High
-            } else {
-                return rankingB - rankingA; // High to Low
-            }
-        });
+        companiesQuery.sort = nextOrder ? 'Ranking' : '';
+        companiesQuery.order = nextOrder || '';
+        companiesQuery.page = 1;
+        loadCompanies();
 
-        // Update the current sort order
-        currentSortOrder = nextOrder;
-        
-        // Update sort icon
-        if (sortIcon) {
-            if (nextOrder === 'asc') {
-                sortIcon.className = 'fas fa-sort-up ms-1';
-            } else {
-                sortIcon.className = 'fas fa-sort-down ms-1';
-            }
-        }
-        
-        // Re-render the table with sorted data
-        renderCompaniesTable(sortedData);
-        
-        // Show success message
-        const message = nextOrder === 'asc' ? 'Sorted by ranking: Low to High' : 'Sorted by ranking: High to Low';
+        const message = nextOrder === 'asc' ? 'Sorted by ranking: Low to High' :
+                        nextOrder === 'desc' ? 'Sorted by ranking: High to Low' : 'Returned to original order';
         showSuccess('Sorted', message);
     };
 
     // Toggle sorting function for CEO Email presence
     window.toggleEmailPresenceSort = function() {
-        if (!companiesData || companiesData.length === 0) {
+        if (!companiesTotal) {
             showWarning('No Data', 'No companies data available to sort.');
             return;
         }
@@ -898,44 +1052,25 @@ document.addEventListener('DOMContentLoaded', function() {
             nextOrder = null; // Return to original order
         }
 
-        const emailSortIcon = document.getElementById('email-sort-icon');
-
-        if (nextOrder === null) {
-            renderCompaniesTable(companiesData);
-            currentEmailSortOrder = null;
-            if (emailSortIcon) emailSortIcon.className = 'fas fa-sort ms-1';
-            showSuccess('Sorted', 'Returned to original order');
-            return;
-        }
-
-        const sortedData = [...companiesData];
-        const presenceValue = (email) => {
-            const val = (email || '').toString().trim();
-            return val ? 1 : 0; // 1 = present, 0 = missing
-        };
-
-        sortedData.sort((a, b) => {
-            const aVal = presenceValue(a['CEO Email']);
-            const bVal = presenceValue(b['CEO Email']);
-            if (nextOrder === 'present') {
-                return bVal - aVal; // Present first
-            } else {
-                return aVal - bVal; // Missing first
-            }
-        });
-
         currentEmailSortOrder = nextOrder;
+        currentSortOrder = null;
+        const sortIcon = document.getElementById('ranking-sort-icon');
+        if (sortIcon) sortIcon.className = 'fas fa-sort ms-1';
 
+        const emailSortIcon = document.getElementById('email-sort-icon');
         if (emailSortIcon) {
-            if (nextOrder === 'present') {
-                emailSortIcon.className = 'fas fa-envelope ms-1';
-            } else {
-                emailSortIcon.className = 'fas fa-envelope-open ms-1';
-            }
+            emailSortIcon.className = nextOrder === 'present' ? 'fas fa-envelope ms-1' :
+                                      nextOrder === 'missing' ? 'fas fa-envelope-open ms-1' : 'fas fa-sort ms-1';
         }
 
-        renderCompaniesTable(sortedData);
-        const message = nextOrder === 'present' ? 'Sorted by CEO Email: Present first' : 'Sorted by CEO Email: Missing first';
+        // Empty emails sort before any address, so descending puts present emails first
+        companiesQuery.sort = nextOrder ? 'CEO Email' : '';
+        companiesQuery.order = nextOrder === 'present' ? 'desc' : nextOrder === 'missing' ? 'asc' : '';
+        companiesQuery.page = 1;
+        loadCompanies();
+
+        const message = nextOrder === 'present' ? 'Sorted by CEO Email: Present first' :
+                        nextOrder === 'missing' ? 'Sorted by CEO Email: Missing first' : 'Returned to original order';
         showSuccess('Sorted', message);
     };
 
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from agent.rate_limiter import TokenBucketRateLimiter
+from agent.sub_agents.tools import perplexity_tool
+from agent.sub_agents.tools.perplexity_tool import (
+    PerplexityRateLimitError, PerplexityResearchBatcher, close_perplexity_client, get_perplexity_client,
+    get_specific_info_tool, perplexity_research_tool
+)
+
+
+def completion(content) -> dict:
+    return {
+        "model": "sonar",
+        "choices": [{"message": {"content": json.dumps(content)}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5}
+    }
+
+
+class StubPerplexity(ThreadingHTTPServer):
+    """Local stand-in for the Perplexity chat completions endpoint.
+
+    Replies are served from `responses` in order as (status, headers, body); every
+    request records the client port it arrived on, so connection reuse is visible.
+    """
+
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.responses = deque()
+        self.requests = []
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/chat/completions"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append({"port": self.client_address[1], "time": time.monotonic(), "payload": payload})
+        status, headers, body = self.server.responses.popleft()
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = StubPerplexity()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    limiter = TokenBucketRateLimiter("perplexity:test", requests_per_minute=6000)
+    monkeypatch.setattr(perplexity_tool, "PERPLEXITY_API_KEY", "test-key")
+    monkeypatch.setattr(perplexity_tool, "PERPLEXITY_API_URL", server.url)
+    monkeypatch.setattr(perplexity_tool, "get_rate_limiter", lambda provider, model: limiter)
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_calls_reuse_one_pooled_connection(stub):
+    stub.responses.extend([
+        (200, {}, completion({"ceo_name": "Jane Doe", "company_revenue": "$5M"})),
+        (200, {}, completion({"ceo_email": "jane@acme.com"})),
+        (200, {}, completion({"ceo_name": "John Roe"}))
+    ])
+
+    async def run():
+        try:
+            research = await perplexity_research_tool("Acme", "https://acme.com")
+            specific = await get_specific_info_tool("Acme", "https://acme.com", ["ceo_email"])
+            second = await perplexity_research_tool("Beta", "https://beta.com")
+        finally:
+            await close_perplexity_client()
+        return research, specific, second
+
+    research, specific, second = asyncio.run(run())
+
+    assert research["ceo_name"] == "Jane Doe"
+    assert research["company_revenue"] == "$5M"
+    assert research["service_focus"] == []
+    assert specific == {"ceo_email": "jane@acme.com"}
+    assert second["ceo_name"] == "John Roe"
+    assert len(stub.requests) == 3
+    assert len({request["port"] for request in stub.requests}) == 1
+    assert "ceo_email" in stub.requests[1]["payload"]["messages"][1]["content"]
+
+
+def test_rate_limited_request_waits_for_retry_after(stub):
+    stub.responses.extend([
+        (429, {"Retry-After": "0.3"}, {"error": "rate limited"}),
+        (200, {}, completion({"ceo_name": "Jane Doe"}))
+    ])
+
+    async def run():
+        try:
+            return await perplexity_research_tool("Acme", "https://acme.com")
+        finally:
+            await close_perplexity_client()
+
+    result = asyncio.run(run())
+
+    assert result["ceo_name"] == "Jane Doe"
+    assert len(stub.requests) == 2
+    assert stub.requests[1]["time"] - stub.requests[0]["time"] >= 0.3
+
+
+def test_rate_limit_error_after_retries_are_exhausted(stub):
+    stub.responses.extend([(429, {"Retry-After": "0"}, {"error": "rate limited"})] * 3)
+
+    async def run():
+        try:
+            return await get_specific_info_tool("Acme", "https://acme.com", ["ceo_name"])
+        finally:
+            await close_perplexity_client()
+
+    with pytest.raises(PerplexityRateLimitError):
+        asyncio.run(run())
+    assert len(stub.requests) == 3
+
+
+def test_close_releases_the_pooled_client(stub):
+    stub.responses.extend([
+        (200, {}, completion({"ceo_name": "Jane Doe"})),
+        (200, {}, completion({"ceo_name": "John Roe"}))
+    ])
+
+    async def run():
+        await perplexity_research_tool("Acme", "https://acme.com")
+        client = get_perplexity_client()
+        await close_perplexity_client()
+        closed = client.is_closed
+
+        # A later call in the same loop opens a fresh client and connection
+        await perplexity_research_tool("Beta", "https://beta.com")
+        reopened = get_perplexity_client()
+        await close_perplexity_client()
+        await close_perplexity_client()
+        return client, closed, reopened
+
+    client, closed, reopened = asyncio.run(run())
+
+    assert closed
+    assert reopened is not client
+    assert reopened.is_closed
+    assert len({request["port"] for request in stub.requests}) == 2
+
+
+def test_batched_fallbacks_share_one_request(stub):
+    stub.responses.append((200, {}, completion([
+        {"company_name": "Acme", "website": "acme.com", "ceo_email": "jane@acme.com", "ceo_name": "Jane Doe"},
+        {"company_name": "Beta", "website": "beta.com", "company_revenue": "$2M"}
+    ])))
+
+    async def run():
+        batcher = PerplexityResearchBatcher(max_batch_size=2, max_wait=5)
+        try:
+            return await asyncio.gather(
+                batcher.research("Acme", "https://acme.com", ["ceo_email"]),
+                batcher.research("Beta", "https://beta.com", ["company_revenue", "client_examples"])
+            )
+        finally:
+            await close_perplexity_client()
+
+    acme, beta = asyncio.run(run())
+
+    assert acme == {"ceo_email": "jane@acme.com"}
+    assert beta == {"company_revenue": "$2M", "client_examples": []}
+    assert len(stub.requests) == 1
+    query = stub.requests[0]["payload"]["messages"][1]["content"]
+    assert "Website: https://acme.com | Find only: CEO email" in query
+    assert "Find only: Annual revenue/revenue range; Notable clients" in query
@@ -13,8 +13,9 @@ import asyncio
 import eventlet
 from google.adk.runners import Runner
 from google.adk.sessions import InMemorySessionService
-from agent.sub_agents.agent import create_email_sequence_agent, create_follow_up_agent
-from agent.sub_agents.tools.perplexity_tool import extract_json_object
+from agent.sub_agents.agent import create_email_sequence_agent, create_follow_up_agent, parse_score
+from agent.json_extract import extract_json_object
+from agent.results import ResultStore
 
 # MCP imports for Gmail draft functionality
 from mcp.client.session import ClientSession
@@ -207,9 +208,7 @@ async def generate_email_content(company_data: dict) -> tuple[str, str]:
                 return None, None
 
             # Extract JSON object robustly (handles fenced code and extra text)
-            content = extract_json_object(content)
-
-            content_json = json.loads(content)
+            content_json = extract_json_object(content)
             subject = content_json.get("subject")
             body = content_json.get("body")
             
@@ -298,8 +297,7 @@ async def generate_follow_up_content(company_data: dict, previous_subject: str)
             if content:
                 try:
                     # Extract JSON object robustly (handles fenced code and extra text)
-                    content = extract_json_object(content)
-                    content_json = json.loads(content)
+                    content_json = extract_json_object(content)
                     return content_json.get('subject'), content_json.get('body')
                 except json.JSONDecodeError:
                     print(f"Error parsing JSON from content: {content}")
@@ -337,7 +335,9 @@ async def generate_follow_up_content(company_data: dict, previous_subject: str)
         print(f"Error generating follow-up email content: {e}")
         return None, None
 
-async def send_emails_task(session_id: str, companies_path: str, mode: str, socketio, app, rank_min=None, rank_max=None, selected_emails=None):
+EMAIL_SOURCE_COLUMNS = ['Company Name', 'CEO Name', 'CEO Email', 'Email', 'Service Focus', 'Target Industries', 'Client Examples', 'Ranking']
+
+async def send_emails_task(session_id: str, results_path: str, mode: str, socketio, app, rank_min=None, rank_max=None, selected_emails=None):
     """Background task to send emails."""
     
     try:
@@ -358,9 +358,13 @@ async def send_emails_task(session_id: str, companies_path: str, mode: str, sock
                 writer = csv.writer(f)
                 writer.writerow(['Company Name', 'Email', 'CEO Name', 'Subject', '1st Email Sent', '2nd Email Sent', '3rd Email Sent'])
 
-        # Read the companies CSV file
+        # Load only the columns the email stage needs from the session's result store
         try:
-            df = pd.read_csv(companies_path)
+            store = ResultStore(results_path)
+            try:
+                df = store.read_frame(EMAIL_SOURCE_COLUMNS)
+            finally:
+                store.close()
             
             # If explicit selections exist, filter by them and ignore ranking
             if selected_emails and isinstance(selected_emails, list) and len(selected_emails) > 0:
@@ -373,7 +377,7 @@ async def send_emails_task(session_id: str, companies_path: str, mode: str, sock
                 # Apply ranking filter if provided
                 if rank_min is not None or rank_max is not None:
                     if 'Ranking' in df.columns:
-                        ranking_series = pd.to_numeric(df['Ranking'], errors='coerce')
+                        ranking_series = pd.to_numeric(df['Ranking'].map(parse_score), errors='coerce')
                     else:
                         ranking_series = pd.Series([None] * len(df), index=df.index, dtype=float)
                     _min = float('-inf') if rank_min is None else rank_min